@@ -1,36 +1,246 @@
 #!/usr/bin/env python3
 
-with open("./real_input.txt") as f:
-    lines = [line.strip() for line in f.readlines()]
+import mmap
+import multiprocessing
+import os
+import re
+import sys
+import time
+from collections import deque
 
 VALS = { "1": 1, "2": 2, "3": 3, "4": 4, "5": 5, "6":6, "7": 7, "8": 8, "9": 9, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9}
 
-sum=0
-for line in lines:
-    if len(line) == 0:
-        continue
-    left=None
-    for i in range(0, len(line)):
-        for val in VALS.keys():
-            if line[i:i+len(val)] == val:
-                left = val
-                break
-        if left != None:
-            break
+def build_automaton(vocabulary):
+    """Compile a word -> digit vocabulary into an Aho-Corasick automaton.
+
+    The automaton is returned as (transitions, outputs, max_word_length). transitions[state] is a
+    complete dict of char -> next state for every character in the vocabulary's alphabet (anything
+    else sends us back to the root, state 0). outputs[state] is a list of (order, length, value)
+    for every word ending in that state, where order is the word's position in the vocabulary and
+    is only used to break ties the same way the original "loop over VALS" code did.
+    """
+    transitions = [{}]
+    outputs = [[]]
+    for order, (word, value) in enumerate(vocabulary.items()):
+        state = 0
+        for char in word:
+            if char not in transitions[state]:
+                transitions.append({})
+                outputs.append([])
+                transitions[state][char] = len(transitions) - 1
+            state = transitions[state][char]
+        outputs[state].append((order, len(word), value))
+
+    # Breadth first walk to fill in the failure links. We fold them straight into the transition
+    # table so the scanning loop never has to follow a failure link.
+    alphabet = set("".join(vocabulary.keys()))
+    fail = [0] * len(transitions)
+    queue = deque()
+    for char in alphabet:
+        child = transitions[0].get(char)
+        if child is None:
+            transitions[0][char] = 0
+        else:
+            queue.append(child)
+    while queue:
+        state = queue.popleft()
+        outputs[state] = outputs[state] + outputs[fail[state]]
+        for char in alphabet:
+            child = transitions[state].get(char)
+            if child is None:
+                transitions[state][char] = transitions[fail[state]][char]
+            else:
+                fail[child] = transitions[fail[state]][char]
+                queue.append(child)
+
+    return transitions, outputs, max(len(word) for word in vocabulary)
+
+def reversed_vocabulary(vocabulary):
+    return {word[::-1]: value for word, value in vocabulary.items()}
 
-    right=None
-    for i in reversed(range(0, len(line))):
-        for val in VALS.keys():
-            if len(val) > len(line) - i:
-                continue
-            if line[i:i+len(val)] == val:
-                right = val
-                break
-        if right != None:
+def leftmost_value(line, automaton):
+    """Value of the word which starts furthest to the left in line.
+
+    Aho-Corasick reports matches in order of where they *end*, so once we have a candidate we keep
+    scanning until no longer word could possibly start before it.
+    """
+    transitions, outputs, max_word_length = automaton
+    best = None
+    state = 0
+    for i, char in enumerate(line):
+        state = transitions[state].get(char, 0)
+        for order, length, value in outputs[state]:
+            candidate = (i - length + 1, order, value)
+            if best is None or candidate < best:
+                best = candidate
+        if best is not None and i >= best[0] + max_word_length - 1:
             break
+    return None if best is None else best[2]
+
+def rightmost_value(line, reversed_automaton):
+    """Value of the word which starts furthest to the right in line.
+
+    Scanning the reversed line with the reversed vocabulary, the first match we hit is exactly the
+    one which starts furthest right in the original line, so we can stop straight away.
+    """
+    transitions, outputs, _ = reversed_automaton
+    state = 0
+    for char in reversed(line):
+        state = transitions[state].get(char, 0)
+        if outputs[state]:
+            return min(outputs[state])[2]
+    return None
+
+def calibration_value(line, automaton, reversed_automaton):
+    return 10 * leftmost_value(line, automaton) + rightmost_value(line, reversed_automaton)
+
+AUTOMATON = build_automaton(VALS)
+REVERSED_AUTOMATON = build_automaton(reversed_vocabulary(VALS))
+
+assert calibration_value("two1nine", AUTOMATON, REVERSED_AUTOMATON) == 29
+assert calibration_value("eightwothree", AUTOMATON, REVERSED_AUTOMATON) == 83
+assert calibration_value("zoneight234", AUTOMATON, REVERSED_AUTOMATON) == 14
+assert calibration_value("oneight", AUTOMATON, REVERSED_AUTOMATON) == 18
+assert calibration_value("7pqrstsixteen", AUTOMATON, REVERSED_AUTOMATON) == 76
+# "b" starts after "abc" but ends before it. Make sure we go by where words start, like the
+# original slicing loop did.
+assert leftmost_value("xabcx", build_automaton({"b": 2, "abc": 1})) == 1
+assert rightmost_value("xabcx", build_automaton(reversed_vocabulary({"b": 2, "abc": 1}))) == 2
+
+def trie_alternation(words):
+    """A regex alternation matching exactly the given words, factored into a trie so the regex
+    engine only ever tries the branch for the character in front of it."""
+    singles = [word for word in words if len(word) == 1]
+    branches = {}
+    for word in words:
+        if len(word) > 1:
+            branches.setdefault(word[0], []).append(word[1:])
+    alternatives = ["[" + "".join(re.escape(word) for word in singles) + "]"] if singles else []
+    for first, rests in branches.items():
+        alternatives.append(re.escape(first) + "(?:" + trie_alternation(rests) + ")")
+    return "|".join(alternatives)
+
+def build_scanner(vocabulary):
+    """A regex which, run over a whole block of text, finds the (leftmost, rightmost) word of
+    every line in one go.
+
+    The lazy lookahead finds the word which starts furthest left, and the greedy [^\n]* then backs
+    off from the end of the line to the word which starts furthest right. Where two words start in
+    the same place the regex takes whichever alternative comes first, which agrees with
+    leftmost_value and rightmost_value as long as the alternatives are in vocabulary order. When no
+    word is a prefix of another, at most one word can start anywhere, so we're free to use the much
+    quicker trie shaped alternation instead.
+
+    Returned as (regex, vocabulary) so sum_of_text can look up the words' values.
+    """
+    words = list(vocabulary)
+    if any(a != b and b.startswith(a) for a in words for b in words):
+        alternation = "|".join(re.escape(word) for word in words)
+    else:
+        alternation = trie_alternation(words)
+    regex = re.compile(f"^(?=[^\n]*?({alternation}))[^\n]*(?=({alternation}))", re.MULTILINE)
+    return regex, dict(vocabulary)
+
+NON_BLANK_LINE = re.compile(r"^[^\S\n]*\S", re.MULTILINE)
+
+def sum_of_text(text, scanner):
+    """The sum of the calibration values of every non blank line in text. Scanning is all done in
+    the regex engine, so this is a lot quicker than calling calibration_value on every line."""
+    regex, vocabulary = scanner
+    words = regex.findall(text)
+    if len(words) != len(NON_BLANK_LINE.findall(text)):
+        raise ValueError("Every line needs at least one word from the vocabulary in it")
+    return sum(10 * vocabulary[left] + vocabulary[right] for left, right in words)
+
+SCANNER = build_scanner(VALS)
+
+test_lines = ["two1nine", "eightwothree", "zoneight234", "oneight", "7pqrstsixteen", "", "  3  "]
+assert sum_of_text("\n".join(test_lines), SCANNER) == 29 + 83 + 14 + 18 + 76 + 33
+assert sum_of_text("xabcx", build_scanner({"b": 2, "abc": 1})) == 12
+# "ab" is a prefix of "abc", so they tie on where they start and vocabulary order decides
+assert sum_of_text("abc", build_scanner({"ab": 1, "abc": 2})) == 10 * leftmost_value("abc", build_automaton({"ab": 1, "abc": 2})) + 1
+assert sum_of_text("abc", build_scanner({"abc": 2, "ab": 1})) == 22
+
+# Chunks are this big give or take a line. Each worker holds one chunk in memory at a time, so
+# this (times the number of processes) is what bounds our memory use, not the size of the file.
+CHUNK_SIZE = 16 * 1024 * 1024
+
+class ProgressReporter:
+    """Prints how far through the file we are, at most once every min_interval seconds."""
+
+    def __init__(self, total_bytes, min_interval=1.0, stream=sys.stderr):
+        self.total_bytes = total_bytes
+        self.min_interval = min_interval
+        self.stream = stream
+        self.bytes_done = 0
+        self.last_report = 0.0
+
+    def __call__(self, num_bytes, partial_sum):
+        self.bytes_done += num_bytes
+        now = time.monotonic()
+        if now - self.last_report >= self.min_interval or self.bytes_done == self.total_bytes:
+            self.last_report = now
+            percent = 100 * self.bytes_done / self.total_bytes
+            print(f"{percent:.1f}% done, partial sum is {partial_sum}", file=self.stream)
+
+def newline_aligned_chunks(mm, chunk_size):
+    """Yield (start, end) byte ranges covering mm where every range ends just after a newline (or
+    at the end of the file)."""
+    start = 0
+    while start < len(mm):
+        end = mm.find(b"\n", min(start + chunk_size, len(mm)) - 1)
+        end = len(mm) if end == -1 else end + 1
+        yield start, end
+        start = end
+
+def sum_of_chunk(filename, start, end, scanner=SCANNER):
+    with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode()
+    return end - start, sum_of_text(text, scanner)
+
+# The scanner _sum_of_chunk uses. Each pool worker builds its own from the vocabulary it's given
+# when it starts up, rather than having it pickled over with every chunk.
+chunk_scanner = SCANNER
+
+def build_chunk_scanner(vocabulary):
+    global chunk_scanner
+    chunk_scanner = build_scanner(vocabulary)
+
+def _sum_of_chunk(args):
+    return sum_of_chunk(*args, chunk_scanner)
+
+def sum_of_calibration_values(filename, processes=None, chunk_size=CHUNK_SIZE, reporter=None, vocabulary=VALS):
+    """Memory map filename, split it into newline aligned chunks and sum each chunk in a process
+    pool, looking for the words in vocabulary. reporter, if given, is called with (bytes in chunk,
+    running total) as chunks complete."""
+    if os.path.getsize(filename) == 0:
+        return 0
+
+    with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        chunks = [(filename, start, end) for start, end in newline_aligned_chunks(mm, chunk_size)]
+
+    if processes == 1 or len(chunks) == 1:
+        scanner = build_scanner(vocabulary)
+        return combine_partial_sums((sum_of_chunk(*chunk, scanner) for chunk in chunks), reporter)
+    with multiprocessing.Pool(processes, initializer=build_chunk_scanner, initargs=(vocabulary,)) as pool:
+        return combine_partial_sums(pool.imap_unordered(_sum_of_chunk, chunks), reporter)
+
+def combine_partial_sums(partials, reporter):
+    total = 0
+    for num_bytes, partial in partials:
+        total += partial
+        if reporter is not None:
+            reporter(num_bytes, total)
+    return total
+
+if __name__ == "__main__":
+    assert sum_of_calibration_values("./test_input_part2.txt") == 281
+    # Tiny chunks so the test input gets split up and handed out to several workers
+    assert sum_of_calibration_values("./test_input_part2.txt", processes=4, chunk_size=8) == 281
+    # Every digit read as 10 minus itself turns each line's 10 * a + b into 110 - (10 * a + b)
+    flipped = {word: 10 - value for word, value in VALS.items()}
+    assert sum_of_calibration_values("./test_input_part2.txt", vocabulary=flipped) == 7 * 110 - 281
+    assert sum_of_calibration_values("./test_input_part2.txt", processes=4, chunk_size=8, vocabulary=flipped) == 7 * 110 - 281
 
-    number=f"{VALS[left]}{VALS[right]}"
-    print(f"Got {number} from {line}")
-    sum += int(number)
-    print(f"Sum is now {sum}")
-print(sum)
+    filename = sys.argv[1] if len(sys.argv) > 1 else "./real_input.txt"
+    print(sum_of_calibration_values(filename, reporter=ProgressReporter(os.path.getsize(filename))))
@@ -36,17 +36,6 @@ def coorindates_of_galaxies(universe):
                 coords.append((irow, icol))
     return coords
 
-def answer_part1(filename):
-    universe = parse_input(filename)
-    universe = expand_universe(universe)
-    coords = coorindates_of_galaxies(universe)
-    sum_distances = 0
-    for icoord, coord in enumerate(coords):
-        for j in range(icoord + 1, len(coords)):
-            sum_distances += distance_between_galaxies(coord, coords[j])
-    return sum_distances
-
-
 expanded_test = """\
 ....#........
 .........#...
@@ -61,20 +50,11 @@ expanded_test = """\
 .........#...
 #....#......."""
 
-# assert (np.array([list(row) for row in expanded_test.split()]) == expand_universe(parse_input("test_input.txt"))).all()
-# assert answer_part1("test_input.txt") == 374
-# assert answer_part1("real_input.txt") == 9556896
+assert (np.array([list(row) for row in expanded_test.split()]) == expand_universe(parse_input("test_input.txt"))).all()
 
 def expansion_rows_and_columns(universe):
-    rows = []
-    cols = []
-    for irow, row in enumerate(universe):
-        if set(row) == set(["."]):
-            rows.append(irow)
-    for icol, col in enumerate(universe.T):
-        if set(col) == set(["."]):
-            cols.append(icol)
-    return rows, cols
+    empty = universe == "."
+    return list(np.flatnonzero(empty.all(axis=1))), list(np.flatnonzero(empty.all(axis=0)))
 
 def distance_between_galaxies_with_expansion_info(index1, index2, exanded_rows_and_cols, expansion_factor=1_000_000):
     """It is assumed that exanded_rows_and_cols will be sorted"""
@@ -114,17 +94,84 @@ assert distance_between_galaxies_with_expansion_info((3, 4), (10, 17), ([5, 9, 1
 
 assert distance_between_galaxies_with_expansion_info((0, 3), (1, 7), ([], [2,5,8]), expansion_factor=10) == 14
 
+def sum_of_pairwise_distances(positions):
+    """Sum of |x_i - x_j| over every pair. Once the positions are sorted, x_i is bigger than the i
+    positions before it, so it contributes i * x_i - (sum of those before it) to the total."""
+    positions = np.sort(np.asarray(positions, dtype=np.int64))
+    n = len(positions)
+    return int(np.dot(positions, 2 * np.arange(n, dtype=np.int64) - n + 1))
+
+assert sum_of_pairwise_distances([3, 0, 1]) == 3 + 1 + 2
+assert sum_of_pairwise_distances([]) == 0
+
+def sum_of_distances_with_expansion_info(coords, exanded_rows_and_cols, expansion_factor):
+    """The same as adding up distance_between_galaxies_with_expansion_info over every pair, but in
+    O(n log n).
+
+    Manhattan distance splits into a row part and a column part, so we do each axis on its own. On
+    an axis, a galaxy at x with b empty lines before it ends up at x + (expansion_factor - 1) * b.
+    Both x and b only go up as we move along the axis, so the distance between two galaxies is the
+    distance between their xs plus (expansion_factor - 1) times the distance between their bs. That
+    lets us sum each separately and keep the numbers small, so nothing overflows even for huge
+    expansion factors.
+    """
+    coords = np.asarray(coords, dtype=np.int64).reshape(-1, 2)
+    total = 0
+    for axis in range(2):
+        positions = coords[:, axis]
+        empty_lines_before = np.searchsorted(np.asarray(exanded_rows_and_cols[axis], dtype=np.int64), positions)
+        total += sum_of_pairwise_distances(positions) + (expansion_factor - 1) * sum_of_pairwise_distances(empty_lines_before)
+    return total
+
+assert sum_of_distances_with_expansion_info([(3, 4), (10, 17)], ([5, 9], [11, 12, 13]), expansion_factor=100) == distance_between_galaxies_with_expansion_info((3, 4), (10, 17), ([5, 9], [11, 12, 13]), expansion_factor=100)
+assert sum_of_distances_with_expansion_info([(0, 0), (0, 2), (2, 2)], ([1], [1]), expansion_factor=10) == 11 + 22 + 11
+
+def parse_galaxy_mask(filename):
+    """The universe as a boolean array which is True wherever there's a galaxy. One byte per cell,
+    straight from the file, rather than one Python string per cell."""
+    with open(filename, "rb") as f:
+        lines = f.read().split()
+    return np.frombuffer(b"".join(lines), dtype=np.uint8).reshape(len(lines), -1) == ord("#")
+
+def scan_universe(mask):
+    """One pass over the mask which gets everything any expansion factor needs.
+
+    Returns (base, expansion_term) such that the sum of distances between every pair of galaxies
+    for an expansion factor f is base + (f - 1) * expansion_term. See
+    sum_of_distances_with_expansion_info for why it splits up like that.
+    """
+    rows, cols = np.nonzero(mask)
+    base = 0
+    expansion_term = 0
+    for positions, is_empty in [(rows, ~mask.any(axis=1)), (cols, ~mask.any(axis=0))]:
+        # How many empty lines come before each line
+        empty_lines_before = np.cumsum(is_empty) - is_empty
+        base += sum_of_pairwise_distances(positions)
+        expansion_term += sum_of_pairwise_distances(empty_lines_before[positions])
+    return base, expansion_term
+
+def sums_of_distances(filename, expansion_factors):
+    """The answer for each of expansion_factors, from a single scan of the universe."""
+    base, expansion_term = scan_universe(parse_galaxy_mask(filename))
+    return [base + (expansion_factor - 1) * expansion_term for expansion_factor in expansion_factors]
+
+assert sums_of_distances("test_input.txt", [2, 10, 100]) == [374, 1030, 8410]
+# The closed form has to match actually expanding the universe and measuring it
+expanded = expand_universe(parse_input("test_input.txt"))
+assert sum_of_distances_with_expansion_info(coorindates_of_galaxies(expanded), ([], []), expansion_factor=1) == 374
+# ...and likewise the expansion info version, given the empty rows and columns of the unexpanded one
+test_universe = parse_input("test_input.txt")
+assert expansion_rows_and_columns(test_universe) == ([3, 7], [2, 5, 8])
+assert sum_of_distances_with_expansion_info(coorindates_of_galaxies(test_universe), expansion_rows_and_columns(test_universe), expansion_factor=10) == 1030
+
+def answer_part1(filename):
+    return sums_of_distances(filename, [2])[0]
+
 def answer_part2(filename, expansion_factor):
-    universe = parse_input(filename)
-    coords = coorindates_of_galaxies(universe)
-    exanded_rows_and_cols = expansion_rows_and_columns(universe)
-    sum_distances = 0
-    for icoord, coord in enumerate(coords):
-        for j in range(icoord + 1, len(coords)):
-            sum_distances += distance_between_galaxies_with_expansion_info(coord, coords[j], exanded_rows_and_cols, expansion_factor=expansion_factor)
-    # print(f"Sum distances: {sum_distances}")
-    return sum_distances
+    return sums_of_distances(filename, [expansion_factor])[0]
 
+assert answer_part1("test_input.txt") == 374
+assert answer_part1("real_input.txt") == 9556896
 assert answer_part2("test_input.txt", expansion_factor=10) == 1030
 assert answer_part2("test_input.txt", expansion_factor=100) == 8410
-print(answer_part2("real_input.txt", expansion_factor=1_000_000) )
\ No newline at end of file
+print(answer_part2("real_input.txt", expansion_factor=1_000_000) )
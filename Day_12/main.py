@@ -1,12 +1,33 @@
 #!/usr/bin/env python3
 
+import bisect
+import dbm
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+import sys
 import time
 
-# Cheap debugging. Not worth important logging
-DEBUGGING = 1
-def debug(msg):
-    if DEBUGGING:
-        print(msg)
+# Tracing, all off by default and switched on from the environment, e.g.
+#
+#   DAY12_DEBUG=1 DAY12_ROW_STATS=stats.jsonl ./main.py
+#
+# DAY12_DEBUG gives a blow by blow account of whichever solver is running. Every call site checks
+# DEBUGGING before calling debug, so when it's off we don't even build the arguments, let alone
+# format them.
+#
+# DAY12_ROW_STATS names a file we append one JSON line to per row with how long the row took and
+# how much work the solver did: DP states for count_arrangements, recursive calls for
+# count_possibilities_for_row. Those counters only get touched when row_stats is set, i.e. while
+# stats are being recorded.
+DEBUGGING = int(os.environ.get("DAY12_DEBUG", "0"))
+ROW_STATS_FILE = os.environ.get("DAY12_ROW_STATS") or None
+row_stats = None
+
+def debug(msg, *args):
+    print(msg % args if args else msg)
 
 def parse_input(filename):
     ret = []
@@ -17,23 +38,29 @@ def parse_input(filename):
             ret.append((conditions, counts))
     return ret
 
-def unfold_inputs_for_part2(conditions_and_counts):
-    return [("?".join([conditions] * 5), counts * 5) for conditions, counts in conditions_and_counts]
+def unfold_inputs_for_part2(conditions_and_counts, unfold_factor=5):
+    return [("?".join([conditions] * unfold_factor), counts * unfold_factor) for conditions, counts in conditions_and_counts]
 
 def recurse(contiguous_blocks, counts):
-    debug(f"recurse: Recursing with contiguous blocks {contiguous_blocks} and counts {counts}")
+    if row_stats is not None:
+        row_stats["calls"] = row_stats.get("calls", 0) + 1
+    if DEBUGGING:
+        debug("recurse: Recursing with contiguous blocks %s and counts %s", contiguous_blocks, counts)
     # If we've no more counts left to allocate then we're almost done. However, we must check
     # that none of the remaining blocks have a "#" in them, otherwise we have a known bad spring
     # which isn't accounted for
     if len(counts) == 0:
-        debug(f"recurse: No more counts")
+        if DEBUGGING:
+            debug("recurse: No more counts")
         for remaining_block in contiguous_blocks:
             if "#" in remaining_block:
-                debug(f"recurse: Bad arrangement. We still have this block remaining {remaining_block}")
+                if DEBUGGING:
+                    debug("recurse: Bad arrangement. We still have this block remaining %s", remaining_block)
                 return 0
         # This is the only branch of this function which can return 1. It's basically a terminal
         # branch. We've found an arrangement that works.
-        debug("recurse: Found good arrangement")
+        if DEBUGGING:
+            debug("recurse: Found good arrangement")
         return 1
 
     front_count = counts[0]
@@ -41,23 +68,27 @@ def recurse(contiguous_blocks, counts):
     while 1:
         # We next have to find the next block that works with the next count.
         front_block_index = None
-        debug(f"Looking for a block for count {front_count} of bad springs")
+        if DEBUGGING:
+            debug("Looking for a block for count %s of bad springs", front_count)
         for i in range(0, len(contiguous_blocks)):
             # This block works because it's big enough to hold the next count.
             if len(contiguous_blocks[i]) >= front_count:
                 front_block_index = i
-                debug(f"recurse: We can use the block {contiguous_blocks[i]} to hold the next count")
+                if DEBUGGING:
+                    debug("recurse: We can use the block %s to hold the next count", contiguous_blocks[i])
                 break
             # If we get here it means the block is too small to hold the next count. That's okay
             # if the block just contains "?"s, but it it contains a known bad spring then this
             # arrangement is invalid.
             if "#" in contiguous_blocks[i]:
-                debug(f"recurse: Bad arrangement. We have a block {contiguous_blocks[i]} that's too small but contains a bad spring")
+                if DEBUGGING:
+                    debug("recurse: Bad arrangement. We have a block %s that's too small but contains a bad spring", contiguous_blocks[i])
                 return total_possilities
 
         # We couldn't find a block big enough to hold our count, so we have a bad arrangement.
         if front_block_index is None:
-            debug(f"recurse: Bad arrangement. Couldn't find a block big enough to hold the next count")
+            if DEBUGGING:
+                debug("recurse: Bad arrangement. Couldn't find a block big enough to hold the next count")
             return total_possilities
 
         # Throw away blocks we've skipped (if any)
@@ -66,11 +97,14 @@ def recurse(contiguous_blocks, counts):
 
         maxi = len(front_block) - front_count + 1
         # Basically slide along the block we have available and try to fit out count in.
-        debug(f"recurse: We have {maxi} possible starting positions in {front_block} for our count {front_count}")
+        if DEBUGGING:
+            debug("recurse: We have %s possible starting positions in %s for our count %s", maxi, front_block, front_count)
         for i in range(0, maxi):
-            debug(f"Trying position {i}/{maxi - 1} for {front_count} sprints in {front_block}")
+            if DEBUGGING:
+                debug("Trying position %s/%s for %s sprints in %s", i, maxi - 1, front_count, front_block)
             if i != 0 and front_block[i - 1] == "#":
-                debug(f"recurse: Can't try any more positions because the previous character is a bad spring which would then be unallocated")
+                if DEBUGGING:
+                    debug("recurse: Can't try any more positions because the previous character is a bad spring which would then be unallocated")
                 break
             if i == maxi - 1:
                 # We at the end of the front block so there won't be anything left to handover. We
@@ -80,7 +114,8 @@ def recurse(contiguous_blocks, counts):
             else:
                 leftover = front_block[i + front_count:]
                 if leftover[0] not in [".", "?"]:
-                    debug(f"recurse: Can't start at position {i} because the next character cannot be a good spring")
+                    if DEBUGGING:
+                        debug("recurse: Can't start at position %s because the next character cannot be a good spring", i)
                     continue
                 leftover = leftover[1:]
             if len(leftover) == 0:
@@ -89,7 +124,8 @@ def recurse(contiguous_blocks, counts):
                 total_possilities += recurse([leftover] + contiguous_blocks[1:], counts[1:])
 
         if "#" in front_block:
-            debug(f"recurse: Our block {front_block} contains a bad spring so we can't ignore it and look further ahead for more blocks.")
+            if DEBUGGING:
+                debug("recurse: Our block %s contains a bad spring so we can't ignore it and look further ahead for more blocks.", front_block)
             break
         contiguous_blocks = contiguous_blocks[1:]
     return total_possilities
@@ -110,11 +146,79 @@ def count_possibilities_for_row(conditions, counts):
             contiguous_blocks.append(current_block)
             current_block = ""
 
-    debug(f"Starting recursive call with contiguous blocks {contiguous_blocks} and counts {counts}")
+    if DEBUGGING:
+        debug("Starting recursive call with contiguous blocks %s and counts %s", contiguous_blocks, counts)
     ret = recurse(contiguous_blocks, counts)
-    print(f"{ret} possibilities for row {conditions} and counts {counts}")
+    if DEBUGGING:
+        debug("%s possibilities for row %s and counts %s", ret, conditions, counts)
     return ret
 
+def count_arrangements(conditions, counts):
+    """Dynamic programming version of count_possibilities_for_row.
+
+    ways[i][j] is the number of ways of arranging conditions[i:] so it has exactly the blocks
+    counts[j:]. Working backwards from the end of the row, there are two things conditions[i] can
+    be:
+
+    * A good spring (if it isn't a "#"), leaving ways[i + 1][j]
+    * The start of a block of counts[j] bad springs, if that block fits here. That needs no "."s in
+      conditions[i:i + counts[j]] and no "#" straight after it. Then we skip the block and the good
+      spring after it, leaving ways[i + counts[j] + 1][j + 1].
+
+    Whether a block of each length fits at each position is looked up from tables worked out up
+    front from prefix counts of "."s. We also only look at the js that could possibly matter at
+    position i: there has to be room for counts[:j] before i and for counts[j:] after it.
+    """
+    n = len(conditions)
+    m = len(counts)
+    is_bad = [char == "#" for char in conditions] + [False]
+    dots_before = [0]
+    for char in conditions:
+        dots_before.append(dots_before[-1] + (char == "."))
+
+    # fits[k][i] says whether a block of k bad springs can start at position i
+    fits = {}
+    for k in set(counts):
+        fits[k] = [i + k <= n and dots_before[i + k] == dots_before[i] and not is_bad[i + k] for i in range(n)]
+
+    # Room needed by counts[:j] (with a good spring after each) and by counts[j:]
+    room_before = [0]
+    for count in counts:
+        room_before.append(room_before[-1] + count + 1)
+    room_after = [room_before[m] - room - 1 for room in room_before]
+
+    ways = [None] * (n + 2)
+    ways[n] = ways[n + 1] = [0] * m + [1]
+    lowest_j = m
+    for i in range(n - 1, -1, -1):
+        current = list(ways[i + 1]) if not is_bad[i] else [0] * (m + 1)
+        while lowest_j > 0 and room_after[lowest_j - 1] <= n - i:
+            lowest_j -= 1
+        highest_j = min(m, bisect.bisect_right(room_before, i))
+        if row_stats is not None:
+            row_stats["states"] = row_stats.get("states", 0) + max(0, highest_j - lowest_j)
+        for j in range(lowest_j, highest_j):
+            count = counts[j]
+            if fits[count][i]:
+                current[j] += ways[i + count + 1][j + 1]
+        ways[i] = current
+        if DEBUGGING:
+            debug("count_arrangements: At position %s (%s) trying counts[%s:%s], ways are now %s", i, conditions[i], lowest_j, highest_j, current)
+    if DEBUGGING:
+        debug("%s arrangements for row %s and counts %s", ways[0][0], conditions, counts)
+    return ways[0][0]
+
+assert count_arrangements("???.###", [1,1,3]) == 1
+assert count_arrangements(".??..??...?##.", [1,1,3]) == 4
+assert count_arrangements("?#?#?#?#?#?#?#?", [1,3,1,6]) == 1
+assert count_arrangements("????.#...#...", [4,1,1]) == 1
+assert count_arrangements("????.######..#####.", [1,6,5]) == 4
+assert count_arrangements("?###????????", [3,2,1]) == 10
+assert count_arrangements("#", [1]) == 1
+assert count_arrangements("#", [2]) == 0
+assert count_arrangements("..", []) == 1
+assert count_arrangements("#.", []) == 0
+
 def validate1(conditions, counts):
     counts = list(reversed(counts))
     cur_length = 0
@@ -158,14 +262,36 @@ def brute1(conditions, counts):
 #         sum_of_all_arrangements += brute1(conditions_and_counts[0], conditions_and_counts[1])
 #     return sum_of_all_arrangements
 
-def answer_part1(filename, brute_force_it=False):
-    all_conditions_and_counts = parse_input(filename)
+def sum_of_arrangements(all_conditions_and_counts, count_function):
+    if ROW_STATS_FILE is None:
+        return sum(count_function(conditions, counts) for conditions, counts in all_conditions_and_counts)
+
+    global row_stats
     sum_of_all_arrangements = 0
-    count_function = brute1 if brute_force_it else count_possibilities_for_row
-    for conditions_and_counts in all_conditions_and_counts:
-        sum_of_all_arrangements += count_function(conditions_and_counts[0], conditions_and_counts[1])
+    with open(ROW_STATS_FILE, "a") as f:
+        for conditions, counts in all_conditions_and_counts:
+            row_stats = {}
+            start = time.perf_counter()
+            arrangements = count_function(conditions, counts)
+            row_stats["seconds"] = time.perf_counter() - start
+            f.write(json.dumps({"conditions": conditions, "counts": counts, "solver": count_function.__name__,
+                                "arrangements": arrangements, **row_stats}) + "\n")
+            sum_of_all_arrangements += arrangements
+    row_stats = None
     return sum_of_all_arrangements
 
+# Every way we have of counting a row's arrangements, fastest first
+SOLVERS = {
+    "dp": count_arrangements,
+    "recursive": count_possibilities_for_row,
+    "brute": brute1,
+}
+
+def answer_part1(filename, brute_force_it=False, solver="dp"):
+    all_conditions_and_counts = parse_input(filename)
+    count_function = SOLVERS["brute" if brute_force_it else solver]
+    return sum_of_arrangements(all_conditions_and_counts, count_function)
+
 # assert count_possibilities_for_row("???.###", [1,1,3]) == 1
 # assert count_possibilities_for_row(".??..??...?##.", [1,1,3]) == 4
 # assert count_possibilities_for_row("?#?#?#?#?#?#?#?", [1,3,1,6]) == 1
@@ -213,21 +339,94 @@ def answer_part1(filename, brute_force_it=False):
 
 # test("real_input.txt")
 
-def answer_part2(filename, brute_force_it=False):
+def answer_part2(filename, brute_force_it=False, unfold_factor=5, solver="dp"):
     all_conditions_and_counts = parse_input(filename)
-    all_conditions_and_counts = unfold_inputs_for_part2(all_conditions_and_counts)
-    sum_of_all_arrangements = 0
-    count_function = brute1 if brute_force_it else count_possibilities_for_row
-    for conditions_and_counts in all_conditions_and_counts:
-        sum_of_all_arrangements += count_function(conditions_and_counts[0], conditions_and_counts[1])
-    return sum_of_all_arrangements
+    all_conditions_and_counts = unfold_inputs_for_part2(all_conditions_and_counts, unfold_factor)
+    count_function = SOLVERS["brute" if brute_force_it else solver]
+    return sum_of_arrangements(all_conditions_and_counts, count_function)
+
+def count_unfolded_row(conditions_counts_and_unfold_factor):
+    conditions, counts, unfold_factor = conditions_counts_and_unfold_factor
+    return count_arrangements(*unfold_inputs_for_part2([(conditions, counts)], unfold_factor)[0])
+
+# Cached counts are only as good as the code that worked them out, so the cache key includes a hash
+# of that code. Changing any of it means the old entries are never looked up again.
+SOLVER_VERSION = hashlib.sha256("".join(
+    inspect.getsource(function) for function in (count_arrangements, unfold_inputs_for_part2, count_unfolded_row)
+).encode()).hexdigest()[:16]
+
+def row_cache_key(conditions, counts, unfold_factor, solver_version=SOLVER_VERSION):
+    return hashlib.sha256(json.dumps([solver_version, conditions, counts, unfold_factor]).encode()).hexdigest()
+
+def batch_sum_of_arrangements(all_conditions_and_counts, unfold_factor=1, cache_path=None, processes=None):
+    """sum_of_arrangements for a whole input, doing as little work as possible.
+
+    Rows are independent, so identical rows only get counted once. If cache_path is given, results
+    are kept in an on-disk cache keyed by a hash of (conditions, counts, unfold_factor), so a rerun
+    on a slightly different input only counts the rows that changed. Whatever's left is shared out
+    over a process pool (or done in this process if processes is 1).
+    """
+    rows = {}
+    multiplicities = {}
+    for conditions, counts in all_conditions_and_counts:
+        key = row_cache_key(conditions, counts, unfold_factor)
+        rows[key] = (conditions, counts, unfold_factor)
+        multiplicities[key] = multiplicities.get(key, 0) + 1
+
+    cache = dbm.open(cache_path, "c") if cache_path is not None else {}
+    try:
+        results = {}
+        misses = []
+        for key in rows:
+            if key in cache:
+                results[key] = int(cache[key])
+            else:
+                misses.append(key)
+
+        if processes == 1 or len(misses) <= 1:
+            counted = map(count_unfolded_row, [rows[key] for key in misses])
+            results.update(zip(misses, counted))
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                counted = pool.map(count_unfolded_row, [rows[key] for key in misses], chunksize=16)
+            results.update(zip(misses, counted))
+
+        for key in misses:
+            cache[key] = str(results[key])
+    finally:
+        if cache_path is not None:
+            cache.close()
+
+    return sum(results[key] * multiplicity for key, multiplicity in multiplicities.items())
+
+# Pool workers import this file too (and with the "spawn" start method they run everything at the
+# top level again), so the answers are only worked out in the parent process.
+#
+# Pass a solver name (one of SOLVERS) to time part 1 with that solver too, e.g. ./main.py recursive
+if __name__ == "__main__":
+    assert answer_part1("test_input.txt") == 21
+    assert answer_part1("real_input.txt") == 7191
+    if len(sys.argv) > 1:
+        t = time.process_time()
+        assert answer_part1("real_input.txt", solver=sys.argv[1]) == 7191
+        elapsed_time = time.process_time() - t
+        print(f"Time to get answer to part 1 with the {sys.argv[1]} solver is {elapsed_time}")
+    assert answer_part2("test_input.txt") == 525152
+    assert batch_sum_of_arrangements(parse_input("test_input.txt") * 3, unfold_factor=5, processes=1) == 3 * 525152
+    assert row_cache_key("?#", [1], 5) != row_cache_key("?#", [1], 5, solver_version="something else")
 
-# assert answer_part2("test_input.txt") == 525152
+    t = time.process_time()
+    answer = answer_part2('real_input.txt')
+    elapsed_time = time.process_time() - t
+    print(f"Answer to part 2 is {answer}")
+    print(f"Time to get answer to part 2 WITHOUT brute force is {elapsed_time}")
 
-t = time.process_time()
-elapsed_time = time.process_time() - t
-print(f"Answer to part 2 is {answer_part2('real_input.txt')}")
-print(f"Time to get answer to part 2 WITHOUT brute force is {elapsed_time}")
+    t = time.perf_counter()
+    batched_answer = batch_sum_of_arrangements(parse_input('real_input.txt'), unfold_factor=5, cache_path=".arrangements_cache")
+    elapsed_time = time.perf_counter() - t
+    assert batched_answer == answer
+    print(f"Answer to part 2 (batched, cached) is {batched_answer}")
+    print(f"Time to get answer to part 2 batched is {elapsed_time}")
 
 # t = time.process_time()
 # elapsed_time = time.process_time() - t
@@ -2,123 +2,122 @@
 
 import numpy as np
 
+def parse_patterns(data):
+    """Split the raw bytes of an input into patterns without copying them.
+
+    The whole input lives in one uint8 buffer. Since every row of a pattern is the same width and
+    ends in a newline, a pattern is just a (height, width + 1) block of that buffer with the newline
+    column sliced off, so each pattern we return is a view rather than a copy. Finding where the
+    patterns start and end is done with whole-array operations on the newline positions.
+    """
+    data = data.replace(b"\r\n", b"\n")
+    if not data.endswith(b"\n"):
+        data += b"\n"
+    buf = np.frombuffer(data, dtype=np.uint8)
+
+    line_ends = np.flatnonzero(buf == ord("\n"))
+    line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+    line_lengths = line_ends - line_starts
+
+    # A pattern starts at any non blank line which is the first line or follows a blank one
+    non_blank = line_lengths > 0
+    if not non_blank.any():
+        return []
+    starts_pattern = non_blank & ~np.concatenate(([False], non_blank[:-1]))
+    first_lines = np.flatnonzero(starts_pattern)
+    pattern_ids = np.cumsum(starts_pattern) - 1
+    widths = line_lengths[first_lines]
+    heights = np.bincount(pattern_ids[non_blank], minlength=len(first_lines))
+    ragged = non_blank & (line_lengths != widths[pattern_ids])
+    if ragged.any():
+        line = int(np.argmax(ragged))
+        raise ValueError(f"Line {line + 1} isn't the same width as the rest of its pattern")
+
+    starts = line_starts[first_lines]
+    return [buf[start:start + height * (width + 1)].reshape(height, width + 1)[:, :width]
+            for start, height, width in zip(starts.tolist(), heights.tolist(), widths.tolist())]
+
 def parse_input(filename):
-    with open(filename) as f:
-        lines = [line.strip() for line in f.readlines()]
-        lines.append("") # Make logic below easier
-
-    patterns = []
-    rows_in_this_pattern = []
-    for line in lines:
-        if len(line) == 0:
-            patterns.append(np.array(rows_in_this_pattern))
-            rows_in_this_pattern = []
-        else:
-            rows_in_this_pattern.append(list(line))
-    return patterns
-
-def find_reflection_line(pattern):
-    for i in range(1, len(pattern[0])):
-        match = i
-        # The reflection line will be to the left of i
-        max_to_check = min(i, len(pattern[0]) - i)
-        for j in range(0, max_to_check):
-            if (pattern.T[i - 1 - j] != pattern.T[i + j]).any():
-                match = None
-                break
-        if match is not None:
-            return match
-    return None
+    with open(filename, "rb") as f:
+        return parse_patterns(f.read())
+
+POWERS_OF_TWO = 1 << np.arange(63, dtype=np.int64)
+
+def encode_pattern(pattern):
+    """Turn a pattern into two lists of ints, one bitmask per row and one per column.
 
-def row_or_column_is_the_same_assuming_smudge(arr1, arr2):
-    comparison = (arr1 != arr2)
-    ret = np.count_nonzero(comparison) in [0, 2]
-    print(f"Comparing {arr1} and {arr2}: they are {'' if ret else 'NOT '}the same")
-    return ret
-
-def find_reflection_line_assuming_smudge(pattern, ignore_me):
-    for i in range(1, len(pattern[0])):
-        if i == ignore_me:
-            continue
-        match = i
-        smudge_count = 0
-        # The reflection line will be to the left of i
-        max_to_check = min(i, len(pattern[0]) - i)
-        for j in range(0, max_to_check):
-            diff_count = np.count_nonzero(pattern.T[i - 1 - j] !=  pattern.T[i + j])
-            if diff_count > 1:
-                match = None
+    Bit c of rows[r] (and bit r of cols[c]) is set if there's a rock at (r, c). Comparing two rows
+    or columns is then just comparing two ints, and the number of cells they differ in is the
+    popcount of their XOR.
+    """
+    rocks = (pattern == ord("#")).view(np.uint8)
+    height, width = rocks.shape
+    if max(height, width) <= len(POWERS_OF_TWO):
+        return (rocks @ POWERS_OF_TWO[:width]).tolist(), (POWERS_OF_TWO[:height] @ rocks).tolist()
+    # Too big for an int64, so fall back to (much slower, but unlimited) Python ints
+    rocks = rocks.astype(object)
+    return ((rocks @ [1 << c for c in range(width)]).tolist(),
+            ([1 << r for r in range(height)] @ rocks).tolist())
+
+def find_reflection_line(masks, smudges=0):
+    """The number of masks before the first reflection line which needs exactly smudges cells
+    fixing to be a perfect mirror, or None if there isn't one."""
+    for i in range(1, len(masks)):
+        differences = 0
+        for j in range(min(i, len(masks) - i)):
+            differences += (masks[i - 1 - j] ^ masks[i + j]).bit_count()
+            if differences > smudges:
                 break
-            elif diff_count == 1:
-                if smudge_count > 0:
-                    match = None
-                    break
-                else:
-                    smudge_count += 1
-        if match is not None:
-            return match
+        if differences == smudges:
+            return i
     return None
 
-def find_reflection_line_for_pattern(pattern):
-    match = find_reflection_line(pattern)
+def find_reflection_line_for_masks(rows, cols, smudges=0):
+    match = find_reflection_line(cols, smudges)
     if match is not None:
         return ("COL", match)
-    match = find_reflection_line(pattern.T)
+    match = find_reflection_line(rows, smudges)
     if match is not None:
         return ("ROW", match)
-    raise Exception(f"Couldn't fine reflection for pattern {pattern}")
+    raise Exception(f"Couldn't find reflection with {smudges} smudge(s) for pattern with rows {rows}")
+
+def find_reflection_line_for_pattern(pattern):
+    return find_reflection_line_for_masks(*encode_pattern(pattern))
 
 def find_reflection_line_for_pattern_assuming_smudge(pattern):
-    ignore_me = find_reflection_line(pattern)
-    if ignore_me is not None:
-        print(f"Looking for reflection column")
-        match = find_reflection_line_assuming_smudge(pattern, ignore_me)
-        print(f"Found reflection column {match} for pattern\n {pattern}\n whilst ignoring {ignore_me}")
-        if match is not None:
-            return ("COL", match)
-    else:
-        print(f"Looking for reflection row")
-        match = find_reflection_line_assuming_smudge(pattern, -1)
-        print(f"Found reflection column {match} for pattern\n {pattern}")
-        if match is not None:
-            return ("COL", match)
-
-    ignore_me = find_reflection_line(pattern.T)
-    if ignore_me is not None:
-        match = find_reflection_line_assuming_smudge(pattern.T, ignore_me)
-        print(f"Found reflection row {match} for pattern\n {pattern}\n whilst ignoring {ignore_me}")
-        if match is not None:
-            return ("ROW", match)
-    else:
-        match = find_reflection_line_assuming_smudge(pattern.T, -1)
-        print(f"Found reflection row {match} for pattern\n {pattern}")
-        if match is not None:
-            return ("ROW", match)
-    raise Exception(f"Couldn't fine reflection for pattern {pattern}")
+    return find_reflection_line_for_masks(*encode_pattern(pattern), smudges=1)
+
+def summarise(reflection):
+    axis, position = reflection
+    return position if axis == "COL" else position * 100
+
+def answers(filename):
+    """Both parts' answers, encoding each pattern only once."""
+    part1 = 0
+    part2 = 0
+    for pattern in parse_input(filename):
+        rows, cols = encode_pattern(pattern)
+        part1 += summarise(find_reflection_line_for_masks(rows, cols))
+        part2 += summarise(find_reflection_line_for_masks(rows, cols, smudges=1))
+    return part1, part2
 
 def answer_part1(filename):
-    patterns = parse_input(filename)
-    total = 0
-    for pattern in patterns:
-        ref = find_reflection_line_for_pattern(pattern)
-        if ref[0] == "COL":
-            total += ref[1]
-        else:
-            total += ref[1] * 100
-    return total
+    return answers(filename)[0]
 
 def answer_part2(filename):
-    patterns = parse_input(filename)
-    total = 0
-    for pattern in patterns:
-        ref = find_reflection_line_for_pattern_assuming_smudge(pattern)
-        if ref[0] == "COL":
-            total += ref[1]
-        else:
-            total += ref[1] * 100
-    return total
-
-
-print(answer_part1("real_input.txt"))
-print(answer_part2("test_input.txt"))
-print(answer_part2("real_input.txt"))
+    return answers(filename)[1]
+
+# Rows 0 and 1 mirror perfectly. Fixing the smudge at (3, 2) makes rows 2 and 3 mirror as well.
+patterns = parse_patterns(b"#.#\n#.#\n..#\n...\n\n\n##\n.#")
+assert [pattern.shape for pattern in patterns] == [(4, 3), (2, 2)]
+assert all(pattern.base is patterns[0].base for pattern in patterns)
+assert encode_pattern(patterns[0]) == ([5, 5, 4, 0], [3, 0, 7])
+assert find_reflection_line([5, 5, 4, 0]) == 1
+assert find_reflection_line([5, 5, 4, 0], smudges=1) == 3
+assert find_reflection_line([5, 4, 1]) is None
+assert answers("test_input.txt") == (405, 400)
+assert answers("real_input.txt") == (27502, 31947)
+
+part1, part2 = answers("real_input.txt")
+print(f"Answer to part 1 is {part1}")
+print(f"Answer to part 2 is {part2}")
@@ -9,95 +9,201 @@ class Direction(Enum):
     DOWN = 2
     LEFT = 3
 
+ROCK = ord("O")
+WALL = ord("#")
+EMPTY = ord(".")
+
 def dump_grid(grid):
     for row in grid:
-        print("".join(row))
+        print(bytes(row).decode())
 
 def parse_input(filename):
-    with open(filename) as f:
-        lines = [list(line.strip()) for line in f.readlines()]
-    return np.array(lines)
-
-def tilt_grid_right_until_nothing_moves(grid):
-    grid = np.rot90(grid, k=1)
-    tilt_grid_up_until_nothing_moves(grid)
-    grid = np.rot90(grid, k=3)
-
-def tilt_grid_left_until_nothing_moves(grid):
-    grid = np.rot90(grid, k=3)
-    tilt_grid_up_until_nothing_moves(grid)
-    grid = np.rot90(grid, k=1)
-
-def tilt_grid_down_until_nothing_moves(grid):
-    grid = np.rot90(grid, k=2)
-    tilt_grid_up_until_nothing_moves(grid)
-    grid = np.rot90(grid, k=2)
-
-def tilt_grid_up_until_nothing_moves(grid):
-    something_moved = True
-    while something_moved:
-        something_moved = False
-        for irow in range(1, len(grid)):
-            for icol in range(len(grid[irow])):
-                if grid[irow, icol] in ['#', '.']:
-                    continue
-                if grid[irow - 1, icol] == ".":
-                    grid[irow - 1, icol] = "O"
-                    grid[irow, icol] = "."
-                    something_moved = True
-
-def perform_one_spin_cycle(grid):
-    tilt_grid_up_until_nothing_moves(grid)
-    tilt_grid_left_until_nothing_moves(grid)
-    tilt_grid_down_until_nothing_moves(grid)
-    tilt_grid_right_until_nothing_moves(grid)
+    with open(filename, "rb") as f:
+        lines = f.read().split()
+    return np.array([np.frombuffer(line, dtype=np.uint8) for line in lines])
+
+class StopTables:
+    """Where a rock in each cell ends up for each direction of tilt, for one fixed set of walls.
+
+    Walls never move, so we can work out once, for every cell and direction, the slot a rock there
+    rolls towards: the cell just past the nearest wall in that direction (or the edge). Rocks
+    sharing a slot stack up behind it one cell at a time. Slots are numbered per direction, so
+    segments[i] is the slot for cell i, slots[n] is the flat index of slot n and step is the flat
+    offset from one stacked rock to the next.
+
+    With those a tilt is just counting the rocks per slot and scattering them back into place, with
+    no rotating or re-scanning of the grid. It isn't allocation free though: the rock mask is a
+    buffer we reuse, but the rock positions, per slot counts and new positions are fresh (small)
+    arrays on every tilt.
+    """
+
+    def __init__(self, grid):
+        height, width = grid.shape
+        walls = grid == WALL
+        rows = np.arange(height)[:, np.newaxis]
+        cols = np.arange(width)[np.newaxis, :]
+        up = np.maximum.accumulate(np.where(walls, rows + 1, 0), axis=0)
+        down = np.minimum.accumulate(np.where(walls, rows - 1, height - 1)[::-1], axis=0)[::-1]
+        left = np.maximum.accumulate(np.where(walls, cols + 1, 0), axis=1)
+        right = np.minimum.accumulate(np.where(walls, cols - 1, width - 1)[:, ::-1], axis=1)[:, ::-1]
+
+        self.tables = {}
+        for direction, stops, step in (
+            (Direction.UP, up * width + cols, width),
+            (Direction.DOWN, down * width + cols, -width),
+            (Direction.LEFT, rows * width + left, 1),
+            (Direction.RIGHT, rows * width + right, -1),
+        ):
+            slots, segments = np.unique(stops, return_inverse=True)
+            self.tables[direction] = (segments.ravel(), slots, step)
+        self.is_rock = np.empty(height * width, dtype=bool)
+
+    def tilt(self, grid, direction):
+        """Tilt grid, which must be C contiguous and have the walls this was built from, in place."""
+        # reshape would quietly give us a copy of anything else, and we'd tilt that instead
+        if not grid.flags.c_contiguous:
+            raise ValueError("StopTables can only tilt C contiguous grids")
+        segments, slots, step = self.tables[direction]
+        cells = grid.reshape(-1)
+        rocks = np.flatnonzero(np.equal(cells, ROCK, out=self.is_rock))
+        counts = np.bincount(segments[rocks], minlength=len(slots))
+        # The n-th rock overall is the (n - rocks in earlier slots)-th rock in its own slot
+        rocks_in_earlier_slots = np.cumsum(counts) - counts
+        positions = np.repeat(slots - rocks_in_earlier_slots * step, counts) + np.arange(len(rocks)) * step
+        cells[rocks] = EMPTY
+        cells[positions] = ROCK
+
+def tilt_grid(grid, direction):
+    """Tilt grid in place. Unlike StopTables.tilt, grid can be any view, e.g. a transpose."""
+    if grid.flags.c_contiguous:
+        StopTables(grid).tilt(grid, direction)
+    else:
+        cells = np.ascontiguousarray(grid)
+        StopTables(cells).tilt(cells, direction)
+        grid[...] = cells
+
+def perform_one_spin_cycle(grid, stop_tables=None):
+    if stop_tables is None:
+        stop_tables = StopTables(grid)
+    for direction in (Direction.UP, Direction.LEFT, Direction.DOWN, Direction.RIGHT):
+        stop_tables.tilt(grid, direction)
 
 def calculate_load(grid):
-    num_rows = len(grid)
-    load = 0
-    for irow in range(num_rows):
-        for icol in range(len(grid[irow])):
-            if grid[irow, icol] == "O":
-                load += num_rows - irow
-    return load
+    return int(((grid == ROCK).sum(axis=1) * np.arange(len(grid), 0, -1)).sum())
 
 def answer_part1(filename):
     grid = parse_input(filename)
-    tilt_grid_up_until_nothing_moves(grid)
+    tilt_grid(grid, Direction.UP)
     return calculate_load(grid)
 
-def hash_grid(grid):
-    return "".join(["".join(row) for row in grid])
+class Bitboard:
+    """A platform's rocks packed into a single int, for keeping and comparing spin cycle states.
+
+    Bit r * width + c is set if there's a rock at (r, c). The walls never move, so they're kept
+    once, in the grid we were built from. Tilting is done on that grid with StopTables, and only
+    the int goes back out, so states are cheap to keep, compare and hash.
+    """
+
+    def __init__(self, grid):
+        self.height, self.width = grid.shape
+        self.grid = grid.copy()
+        self.walls = grid == WALL
+        self.stop_tables = StopTables(grid)
+
+    def rocks_from_grid(self, grid):
+        return int.from_bytes(np.packbits((grid == ROCK).ravel(), bitorder="little").tobytes(), "little")
 
-def answer_part2(filename):
-    NUM_CYCLES = 1000000000
+    def grid_from_rocks(self, rocks):
+        """Unpack rocks into self.grid (which is reused, so copy it to keep it) and return it."""
+        num_cells = self.height * self.width
+        packed = np.frombuffer(rocks.to_bytes((num_cells + 7) // 8, "little"), dtype=np.uint8)
+        is_rock = np.unpackbits(packed, count=num_cells, bitorder="little").reshape(self.height, self.width)
+        self.grid[...] = np.where(self.walls, WALL, np.where(is_rock, ROCK, EMPTY))
+        return self.grid
+
+    def spin_cycle(self, rocks):
+        grid = self.grid_from_rocks(rocks)
+        perform_one_spin_cycle(grid, self.stop_tables)
+        return self.rocks_from_grid(grid)
+
+    def load(self, rocks):
+        row_mask = (1 << self.width) - 1
+        return sum(((rocks >> (irow * self.width)) & row_mask).bit_count() * (self.height - irow)
+                   for irow in range(self.height))
+
+def find_cycle(f, x0):
+    """Brent's cycle detection. Returns (mu, lam): the sequence x0, f(x0), f(f(x0)), ... first
+    repeats a value at step mu + lam, going back to step mu.
+
+    Only two states are held at a time. Comparing big states is where the time goes, so we compare
+    a 64 bit hash of each first and only check the states themselves when the hashes match.
+    """
+    def same(a, b):
+        return a[0] == b[0] and a[1] == b[1]
+
+    def step(x):
+        x = f(x[1])
+        return hash(x), x
+
+    start = (hash(x0), x0)
+    power = lam = 1
+    tortoise = start
+    hare = step(start)
+    while not same(tortoise, hare):
+        if power == lam:
+            tortoise = hare
+            power *= 2
+            lam = 0
+        hare = step(hare)
+        lam += 1
+
+    tortoise = hare = start
+    for _ in range(lam):
+        hare = step(hare)
+    mu = 0
+    while not same(tortoise, hare):
+        tortoise = step(tortoise)
+        hare = step(hare)
+        mu += 1
+    return mu, lam
+
+def answer_part2(filename, num_cycles=1000000000):
     grid = parse_input(filename)
-    print()
-    hashes = {}
-    istep = 0
-    end_of_first_cycle = None
-    while 1:
-        hsh = hash_grid(grid)
-        if hsh in hashes:
-            if end_of_first_cycle is None:
-                print(f"Found first loop at step {istep}")
-                end_of_first_cycle = istep
-                istep = 0
-                hashes = {hsh: 0}
-            else:
-                break
-        else:
-            hashes[hsh] = istep
-        perform_one_spin_cycle(grid)
-        istep += 1
-
-    print(f"Cycle found {istep}")
-    remainder = (NUM_CYCLES - end_of_first_cycle) % istep
-    for i in range(remainder):
-        perform_one_spin_cycle(grid)
-    return calculate_load(grid)
+    board = Bitboard(grid)
+    rocks = board.rocks_from_grid(grid)
+    mu, lam = find_cycle(board.spin_cycle, rocks)
+    # Any state past mu + lam is the same as one lam cycles earlier
+    steps = num_cycles if num_cycles < mu else mu + (num_cycles - mu) % lam
+    for _ in range(steps):
+        rocks = board.spin_cycle(rocks)
+    return board.load(rocks)
 
 assert answer_part1("test_input.txt") == 136
 assert answer_part1("real_input.txt") == 109638
 assert answer_part2("test_input.txt") == 64
+
+grid = np.array([np.frombuffer(row, dtype=np.uint8) for row in [b"O.#O", b"..O.", b"O#.O"]])
+tilt_grid(grid, Direction.RIGHT)
+assert grid.tobytes() == b".O#O...OO#.O"
+tilt_grid(grid, Direction.DOWN)
+assert grid.tobytes() == b"..#O.O.OO#.O"
+# Tilting the transpose down is tilting the grid right
+tilt_grid(grid.T, Direction.DOWN)
+assert grid.tobytes() == b"..#O..OOO#.O"
+try:
+    StopTables(grid.T).tilt(grid.T, Direction.UP)
+    assert False, "Tilting a non contiguous view should fail"
+except ValueError:
+    pass
+
+assert find_cycle(lambda x: (x * x + 1) % 255, 3) == (2, 6)
+# Packing the rocks into a bitboard and back shouldn't lose anything
+grid = parse_input("test_input.txt")
+board = Bitboard(grid)
+rocks = board.rocks_from_grid(grid)
+assert (board.grid_from_rocks(rocks) == grid).all()
+assert board.load(rocks) == calculate_load(grid)
+perform_one_spin_cycle(grid)
+assert board.spin_cycle(rocks) == board.rocks_from_grid(grid)
+assert answer_part2("test_input.txt", num_cycles=2) == 69
 print(answer_part2("real_input.txt"))
\ No newline at end of file
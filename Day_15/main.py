@@ -17,41 +17,43 @@ def answer_part1(filename):
     return sum([hash_string(step) for step in parse_input(filename)])
 
 class HASHMAP:
+    """Boxes of lenses, one box per hash value.
+
+    Each box is a dict of label -> focal length. Dicts remember insertion order, and assigning to a
+    label that's already there keeps its place, which is exactly how lenses behave in a box. So
+    setting, replacing and removing a lens are all O(1) however full the box gets.
+    """
 
     def __init__(self, size=256, hash_function=hash_string):
         self.size = size
         self.hash_function = hash_function
-        self.hash_map = []
-        for i in range(self.size):
-            self.hash_map.append([[], []])
+        self.hash_map = [{} for _ in range(self.size)]
 
     def __setitem__(self, key, value):
-        hash_value = self.hash_function(key)
-        keys, values =  self.hash_map[hash_value]
-        try:
-            index = keys.index(key)
-            values[index] = value
-        except ValueError:
-            keys.append(key)
-            values.append(value)
+        self.hash_map[self.hash_function(key)][key] = value
 
     def __delitem__(self, key):
-        hash_value = self.hash_function(key)
-        keys, values =  self.hash_map[hash_value]
-        try:
-            index = keys.index(key)
-            del keys[index]
-            del values[index]
-        except:
-            pass
+        # Removing a lens that isn't in the box does nothing
+        self.hash_map[self.hash_function(key)].pop(key, None)
 
     def focussing_powers(self):
         total = 0
         for ibox, box in enumerate(self.hash_map):
-            for ival, val in enumerate(box[1]):
+            for ival, val in enumerate(box.values()):
                 total += (1 + ibox) * (1 + ival) * val
         return total
 
+hmap = HASHMAP(size=1, hash_function=lambda key: 0)
+hmap["a"] = 1
+hmap["b"] = 2
+hmap["c"] = 3
+hmap["a"] = 4
+del hmap["b"]
+del hmap["z"]
+hmap["b"] = 5
+assert list(hmap.hash_map[0].items()) == [("a", 4), ("c", 3), ("b", 5)]
+assert hmap.focussing_powers() == 4 + 2 * 3 + 3 * 5
+
 def answer_part2(filename):
     steps = parse_input(filename)
     hmap = HASHMAP()
@@ -1,62 +1,167 @@
 #!/usr/bin/env python3
 
-import re
-
-with open("./AOCDay2/Resources/real_input.txt") as f:
-    lines = [line.strip() for line in f.readlines()]
-
-games = []
-for i, line in enumerate(lines):
-    game_tag = f"Game {i+1}: "
-    if not line.startswith(game_tag):
-        raise ValueError(f"Expected line {i} to start with 'Game {i}', but it didn't")
-    line = line.replace(game_tag, "")
-    games.append(line.split(";"))
-
-def num_colour_per_draw(draw, colour):
-    m = re.search(f"(\d+) {colour}", draw)
-    if not m:
-        return 0
-    else:
-        return int(m.group(1))
-
-max_red = 12
-max_green = 13
-max_blue = 14
-sum_ids = 0
-for id, game in enumerate(games):
-    bad_game = False
-    for draw in game:
-        num_red = num_colour_per_draw(draw, "red")
-        num_green = num_colour_per_draw(draw, "green")
-        num_blue = num_colour_per_draw(draw, "blue")
-
-        if num_red > max_red or num_green > max_green or num_blue > max_blue:
-            print(f"Game {id+1} is invalid due to draw {draw}")
-            bad_game = True
-            break
-    if not bad_game:
-        sum_ids += (id + 1)
-
-print(f"Answer to part 1: {sum_ids}")
-# 12 red cubes, 13 green cubes, and 14 blue cubes
+import numpy as np
+
+class GameIndex:
+    """Columnar view of a list of games.
+
+    ids[i] is the id of game i and max_counts[i, c] holds the most cubes of colours[c] seen in any
+    single draw of that game. That's all either part of the puzzle ever needs, so once this is built
+    we never look at the text again.
+    """
+
+    def __init__(self, ids, colours, max_counts):
+        self.ids = ids
+        self.colours = colours
+        self.max_counts = max_counts
+
+    def limits_array(self, limits):
+        """Turn a list of {colour: max cubes} dicts into rows lined up with self.colours. A colour
+        that's missing from a dict isn't in the bag, so we allow zero of it."""
+        array = np.zeros((len(limits), len(self.colours)), dtype=np.int64)
+        for i, limit in enumerate(limits):
+            for colour, count in limit.items():
+                if colour in self.colours:
+                    array[i, self.colours.index(colour)] = count
+        return array
+
+    def sum_of_possible_game_ids(self, limits, batch_size=None):
+        """For each {colour: max cubes} dict in limits, the sum of the ids of the games which could
+        have been played with that many cubes.
+
+        We compare every game against a batch of limits at once. The batch is sized so the boolean
+        (batch, games) matrix stays around 16M entries, however many games we have.
+        """
+        limits = self.limits_array(limits)
+        if batch_size is None:
+            batch_size = max(1, 16_000_000 // max(1, len(self.ids)))
+        sums = np.empty(len(limits), dtype=np.int64)
+        for start in range(0, len(limits), batch_size):
+            batch = limits[start:start + batch_size]
+            possible = (self.max_counts[np.newaxis, :, :] <= batch[:, np.newaxis, :]).all(axis=2)
+            sums[start:start + batch_size] = possible @ self.ids
+        return sums
+
+    def sum_of_powers(self):
+        return int(np.prod(self.max_counts, axis=1).sum())
+
+class DrawTokens:
+    """Every "<count> <colour>" in the input as a row of (game_id, draw_idx, colour_id, count)."""
+
+    def __init__(self, game_ids, draw_idxs, colour_ids, counts, colours, all_game_ids):
+        self.game_ids = game_ids
+        self.draw_idxs = draw_idxs
+        self.colour_ids = colour_ids
+        self.counts = counts
+        self.colours = colours
+        # Kept separately so games with no draws at all still turn up in the index.
+        self.all_game_ids = all_game_ids
+
+def runs(mask):
+    """(starts, ends) of every run of True in mask, with ends exclusive."""
+    edges = np.flatnonzero(np.diff(mask, prepend=False, append=False))
+    return edges[0::2], edges[1::2]
+
+def tokenise(data):
+    """Split the raw bytes of an input file into DrawTokens.
 
-sum_powers = 0
-for id, game in enumerate(games):
-    min_num_red = 0
-    min_num_green = 0
-    min_num_blue = 0
+    This is done with whole-array operations rather than a regex loop: find every run of digits,
+    turn each run into a number, then classify it by the character after it. A ":" means it's a
+    game id, a " " means it's a count and the lowercase word after the space is its colour.
+    """
+    # A trailing newline means every number has a character after it, even in a truncated file.
+    buf = np.frombuffer(data + b"\n", dtype=np.uint8)
 
-    for draw in game:
-        num_red = num_colour_per_draw(draw, "red")
-        num_green = num_colour_per_draw(draw, "green")
-        num_blue = num_colour_per_draw(draw, "blue")
+    is_digit = (buf >= ord("0")) & (buf <= ord("9"))
+    starts, ends = runs(is_digit)
+    digits = (buf[is_digit] - ord("0")).astype(np.int64)
+    digit_positions = np.flatnonzero(is_digit)
+    lengths = ends - starts
+    place_values = 10 ** (np.repeat(ends - 1, lengths) - digit_positions)
+    values = np.add.reduceat(digits * place_values, np.cumsum(lengths) - lengths) if len(starts) else digits
 
-        min_num_blue = max(min_num_blue, num_blue)
-        min_num_green = max(min_num_green, num_green)
-        min_num_red = max(min_num_red, num_red)
+    following = buf[ends]
+    is_tag = following == ord(":")
+    is_count = following == ord(" ")
+    if not (is_tag | is_count).all():
+        bad = starts[~(is_tag | is_count)][0]
+        raise ValueError(f"Unexpected number at byte {bad}: {bytes(buf[bad:bad + 20])}")
+    tag_positions, tag_values = starts[is_tag], values[is_tag]
+    count_starts, count_ends, counts = starts[is_count], ends[is_count], values[is_count]
 
-    power = min_num_red * min_num_green * min_num_blue
-    sum_powers += power
+    rows = np.searchsorted(tag_positions, count_starts, side="right") - 1
+    if len(rows) and rows[0] < 0:
+        raise ValueError(f"Found a draw at byte {count_starts[0]} before any 'Game <id>:' tag")
+    game_ids = tag_values[rows]
 
-print(f"Answer to part 2: {sum_powers}")
\ No newline at end of file
+    # The draw index is just the number of ";"s between the game tag and the count.
+    separators = np.flatnonzero(buf == ord(";"))
+    draw_idxs = (np.searchsorted(separators, count_starts) - np.searchsorted(separators, tag_positions[rows])).astype(np.int32)
+
+    # Each count is followed by a space and then its colour, a run of lowercase letters.
+    word_starts, word_ends = runs((buf >= ord("a")) & (buf <= ord("z")))
+    words = np.searchsorted(word_starts, count_ends + 1)
+    if len(words) and (words.max() >= len(word_starts) or (word_starts[words] != count_ends + 1).any()):
+        raise ValueError("Every count must be followed by a space and a colour")
+    word_starts, word_lengths = word_starts[words], word_ends[words] - word_starts[words]
+
+    # Pack every colour name into a fixed width byte string so they can be compared as whole
+    # arrays, then number them in the order they first turn up. There are only ever a handful of
+    # colours, so one pass over the not-yet-numbered names per colour beats sorting them all.
+    width = int(word_lengths.max()) if len(word_lengths) else 1
+    offsets = np.arange(width)
+    names = buf[np.minimum(word_starts[:, np.newaxis] + offsets, len(buf) - 1)]
+    names[offsets >= word_lengths[:, np.newaxis]] = 0
+    names = np.ascontiguousarray(names).view(f"S{width}").ravel()
+    colour_ids = np.empty(len(names), dtype=np.int32)
+    colours = []
+    unnumbered = np.arange(len(names))
+    while len(unnumbered):
+        name = names[unnumbered[0]]
+        same = names[unnumbered] == name
+        colour_ids[unnumbered[same]] = len(colours)
+        colours.append(name.decode())
+        unnumbered = unnumbered[~same]
+
+    return DrawTokens(game_ids, draw_idxs, colour_ids, counts, colours, tag_values)
+
+def build_index(tokens):
+    # Game ids don't have to be sequential (or even sorted), so map them onto rows. If an id turns
+    # up more than once its draws are treated as one game. Sorting is only needed when the ids
+    # aren't already in increasing order, which they usually are.
+    ids = tokens.all_game_ids
+    if not (np.diff(ids) > 0).all():
+        ids = np.unique(ids)
+    rows = np.searchsorted(ids, tokens.game_ids)
+    max_counts = np.zeros((len(ids), len(tokens.colours)), dtype=np.int64)
+    # The max over every draw is the same as the max over every count, so draw_idxs isn't needed
+    # here.
+    np.maximum.at(max_counts, (rows, tokens.colour_ids), tokens.counts)
+    return GameIndex(ids, tokens.colours, max_counts)
+
+def parse_games(data):
+    return build_index(tokenise(data))
+
+def read_games(filename):
+    with open(filename, "rb") as f:
+        return parse_games(f.read())
+
+test_games = read_games("./AOCDay2/Resources/test_input.txt")
+assert test_games.colours == ["blue", "red", "green"]
+assert test_games.sum_of_possible_game_ids([{"red": 12, "green": 13, "blue": 14}])[0] == 8
+assert list(test_games.sum_of_possible_game_ids([{"red": 12, "green": 13, "blue": 14}, {}, {"red": 20, "green": 20, "blue": 20}], batch_size=2)) == [8, 0, 15]
+assert test_games.sum_of_powers() == 2286
+
+tokens = tokenise(b"Game 7: 1 red, 2 pink; 3 red\nGame 3: 4 pink\nGame 12: 13 red")
+assert tokens.colours == ["red", "pink"]
+assert list(tokens.game_ids) == [7, 7, 7, 3, 12]
+assert list(tokens.draw_idxs) == [0, 0, 1, 0, 0]
+assert list(tokens.colour_ids) == [0, 1, 0, 1, 0]
+assert list(tokens.counts) == [1, 2, 3, 4, 13]
+assert list(build_index(tokens).sum_of_possible_game_ids([{"red": 3, "pink": 2}, {"pink": 4}, {"red": 13}])) == [7, 3, 12]
+
+games = read_games("./AOCDay2/Resources/real_input.txt")
+
+# 12 red cubes, 13 green cubes, and 14 blue cubes
+print(f"Answer to part 1: {games.sum_of_possible_game_ids([{'red': 12, 'green': 13, 'blue': 14}])[0]}")
+print(f"Answer to part 2: {games.sum_of_powers()}")
@@ -1,58 +1,99 @@
 #!/usr/bin/env python3
 
-def read_file(filename):
-    with open(filename) as f:
-        lines = [line.strip() for line in f.readlines() if line.strip() != ""]
-    return lines
+import sys
+from collections import deque
 
-def num_winning_numbers_on_card(winning_numbers, your_numbers):
-    num_winning_numbers = 0
-    for number in your_numbers:
-        if number in winning_numbers:
-            num_winning_numbers += 1
+def bitmask(numbers):
+    # Card numbers are small non-negative ints, so a set of them fits nicely into the bits of a
+    # single Python int. Bit n is set if n is in the set.
+    mask = 0
+    for number in numbers:
+        mask |= 1 << number
+    return mask
 
-    return num_winning_numbers
+def num_winning_numbers_on_card(winning_numbers, your_numbers):
+    return (winning_numbers & your_numbers).bit_count()
 
-def card_value(winning_numbers, your_numbers):
-    num_winning_numbers = num_winning_numbers_on_card(winning_numbers, your_numbers)
+def card_value(num_winning_numbers):
     return 2 ** (num_winning_numbers - 1) if num_winning_numbers > 0 else 0
 
 def parse_line(line):
     # Pushing my luck with the length of these comprehensions. For prod code I'd break them up.
     # Readability FTW!
-    winning_numbers = [int(number) for number in line[line.index(":") + 1:line.index("|")].strip().split()]
-    your_numbers = [int(number) for number in line[line.index("|") + 1:].strip().split()]
+    winning_numbers = bitmask(int(number) for number in line[line.index(":") + 1:line.index("|")].split())
+    your_numbers = bitmask(int(number) for number in line[line.index("|") + 1:].split())
     return winning_numbers, your_numbers
 
-def answer_part_1(filename):
-    lines = read_file(filename)
+assert num_winning_numbers_on_card(*parse_line("Card 1: 41 48 83 86 17 | 83 86  6 31 17  9 48 53")) == 4
+assert num_winning_numbers_on_card(*parse_line("Card 6: 31 18 13 56 72 | 74 77 10 23 35 67 36 11")) == 0
+
+def running_totals(match_counts):
+    """Yields the (part 1, part 2) totals so far after each card, given each card's number of
+    winning numbers.
+
+    Each card wins a copy of each of the next N cards for every copy of it we hold. Rather than
+    adding to each of those N cards one at a time we keep differences: add our copies where the run
+    of won cards starts and take them off again just after it ends. The running sum of the
+    differences is then the number of extra copies of the current card. A card can only reach N
+    cards ahead, so we only ever hold the next max(N) + 1 differences, however big the deck is.
+    """
+    part_1 = 0
+    part_2 = 0
+    extra_copies = 0
+    differences = deque()
+    for num_winning_numbers in match_counts:
+        if differences:
+            extra_copies += differences.popleft()
+        copies = 1 + extra_copies
+        part_1 += card_value(num_winning_numbers)
+        part_2 += copies
+        if num_winning_numbers > 0:
+            while len(differences) <= num_winning_numbers:
+                differences.append(0)
+            differences[0] += copies
+            differences[num_winning_numbers] -= copies
+        yield part_1, part_2
 
-    total = 0
-    for line in lines:
-        winning_numbers, your_numbers = parse_line(line)
-        total += card_value(winning_numbers, your_numbers)
-    return total
+def final_totals(match_counts):
+    totals = (0, 0)
+    for totals in running_totals(match_counts):
+        pass
+    return totals
 
-assert {answer_part_1('Day_4/test_input.txt') == 13}
-print(f"Answer to Part 1 is {answer_part_1('Day_4/real_input.txt')}")
+assert final_totals([4, 2, 2, 1, 0, 0]) == (13, 30)
+# Winning more cards than there are left in the deck just stops at the end of the deck
+assert final_totals([5, 0]) == (16, 3)
+
+def read_cards(f):
+    """Lazily yields the number of winning numbers on each card in the file object f."""
+    for line in f:
+        line = line.strip()
+        if line != "":
+            yield num_winning_numbers_on_card(*parse_line(line))
+
+def answers(filename):
+    """Streams through the deck once and returns the answers to both parts."""
+    with open(filename) as f:
+        return final_totals(read_cards(f))
+
+def answer_part_1(filename):
+    return answers(filename)[0]
 
 def answer_part_2(filename):
-    lines = read_file(filename)
-
-    num_cards = 0
-    multipliers = [1] * len(lines)
-    for iline, line in enumerate(lines):
-        # Add the number of this card to the total
-        num_cards += multipliers[iline]
-        winning_numbers, your_numbers = parse_line(line)
-        num_winning_numbers = num_winning_numbers_on_card(winning_numbers, your_numbers)
-        for i in range(0, min(num_winning_numbers, len(lines) - iline)):
-            # This is where the magic happens! We go theough the next N cards, where N is the
-            # number of winning numbers for this card. We win one of each of those cards for each
-            # of this card we have, i.e. we get another multipliers[iline] of each of the next N
-            # cards.
-            multipliers[i + iline + 1] += multipliers[iline]
-    return num_cards
-
-assert {answer_part_2('Day_4/test_input.txt') == 30}
-print(f"Answer to Part 2 is {answer_part_2('Day_4/real_input.txt')}")
\ No newline at end of file
+    return answers(filename)[1]
+
+# Pass "-" to read a deck from stdin, e.g. from a pipe. We print the totals so far every so often,
+# and once more when the deck runs out.
+REPORT_EVERY = 10_000
+if sys.argv[1:] == ["-"]:
+    part_1, part_2 = 0, 0
+    for icard, (part_1, part_2) in enumerate(running_totals(read_cards(sys.stdin)), start=1):
+        if icard % REPORT_EVERY == 0:
+            print(f"After {icard} cards: Part 1 is {part_1}, Part 2 is {part_2}", flush=True)
+    print(f"Answer to Part 1 is {part_1}")
+    print(f"Answer to Part 2 is {part_2}")
+else:
+    assert answers('Day_4/test_input.txt') == (13, 30)
+    part_1, part_2 = answers('Day_4/real_input.txt')
+    print(f"Answer to Part 1 is {part_1}")
+    print(f"Answer to Part 2 is {part_2}")
@@ -2,6 +2,8 @@
 
 import math
 
+import numpy as np
+
 def answer_for_input_file(filename, smoosh_numbers=False):
     with open(filename) as f:
         data = f.readlines()
@@ -13,30 +15,31 @@ def answer_for_input_file(filename, smoosh_numbers=False):
     else:
         times = [int(time) for time in data[0].replace("Time:", "").split()]
         distances = [int(time) for time in data[1].replace("Distance:", "").split()]
-    time_and_distance_pairs = zip(times, distances)
 
-    result = 1
-    for time_and_distance_pair in time_and_distance_pairs:
-        ret = num_ways_of_winning_race(*time_and_distance_pair)
-        print(f"There are {ret} ways of winning race {time_and_distance_pair}")
-        result *= ret
-    return result
+    return math.prod(int(ways) for ways in num_ways_of_winning_races(times, distances))
 
 def num_ways_of_winning_race(time, distance):
-    # If this isn't true then the record isn't beatable
-    assert (time > 2 * math.sqrt(distance))
+    """Number of whole button press lengths x with x * (time - x) > distance.
 
-    lower_bound = (time - math.sqrt(time ** 2 - 4 * distance)) / 2
-    if math.ceil(lower_bound) == lower_bound:
-        lower_bound = int(lower_bound) + 1
-    else:
-        lower_bound = math.ceil(lower_bound)
+    Everything here is integer maths so it's exact however big the numbers get. math.sqrt would
+    start rounding once time ** 2 - 4 * distance no longer fits in a float's 53 bit mantissa.
+    """
+    discriminant = time ** 2 - 4 * distance
+    if time <= 0 or discriminant <= 0:
+        # The record isn't beatable
+        return 0
 
-    upper_bound = (time + math.sqrt(time ** 2 - 4 * distance)) / 2
-    if math.floor(upper_bound) == upper_bound:
-        upper_bound = int(upper_bound) - 1
-    else:
-        upper_bound = math.floor(upper_bound)
+    # The winning presses are the integers strictly between the roots (time ± sqrt(disc)) / 2.
+    # isqrt gets us to within one of the lower bound, then we nudge it into place.
+    lower_bound = (time - math.isqrt(discriminant)) // 2
+    while lower_bound < time and lower_bound * (time - lower_bound) <= distance:
+        lower_bound += 1
+    while lower_bound > 1 and (lower_bound - 1) * (time - lower_bound + 1) > distance:
+        lower_bound -= 1
+    if lower_bound >= time:
+        return 0
+    # The race is symmetric, so the upper bound mirrors the lower one
+    upper_bound = time - lower_bound
 
     # Sanity check that our bounds are optimal
     assert (time - upper_bound) * upper_bound > distance
@@ -46,6 +49,53 @@ def num_ways_of_winning_race(time, distance):
 
     return upper_bound - lower_bound + 1
 
+# Above this time**2 - 4 * distance might not be exact as a float64, so those races go through
+# num_ways_of_winning_race instead.
+MAX_FLOAT_EXACT_TIME = math.isqrt(2 ** 53)
+
+def num_ways_of_winning_races(times, distances):
+    """num_ways_of_winning_race for a whole table of races at once.
+
+    Races with small enough times are solved with NumPy: a float estimate of the lower bound which
+    is then corrected in int64 arithmetic, so the answer is still exact. Anything bigger falls back
+    to the exact integer version one row at a time.
+    """
+    try:
+        times = np.asarray(times, dtype=np.int64)
+        distances = np.asarray(distances, dtype=np.int64)
+    except OverflowError:
+        # Too big for int64 at all, so it's the slow path for everything
+        return np.array([num_ways_of_winning_race(int(t), int(d)) for t, d in zip(times, distances)], dtype=object)
+
+    ways = np.zeros(times.shape, dtype=np.int64)
+    # The first few conditions mask out any rows where the int64 maths in the last one could overflow
+    fast = (times > 0) & (times <= MAX_FLOAT_EXACT_TIME) & (distances >= 0) & (distances <= 2 ** 51) & (4 * distances < times * times)
+    t = times[fast]
+    d = distances[fast]
+    lower_bound = np.floor((t - np.sqrt((t * t - 4 * d).astype(np.float64))) / 2).astype(np.int64) + 1
+    # The float estimate can be out by one either way
+    lower_bound += lower_bound * (t - lower_bound) <= d
+    lower_bound -= (lower_bound > 1) & ((lower_bound - 1) * (t - lower_bound + 1) > d)
+    ways[fast] = np.maximum(t - 2 * lower_bound + 1, 0)
+
+    # Anything else with a small time and a non negative distance can't be won at all (so stays at
+    # zero). It's only big times and negative distances we have to do the slow way.
+    for i in np.flatnonzero(~fast & (times > 0) & ((times > MAX_FLOAT_EXACT_TIME) | (distances < 0))):
+        ways[i] = num_ways_of_winning_race(int(times[i]), int(distances[i]))
+    return ways
+
+assert num_ways_of_winning_race(7, 9) == 4
+assert num_ways_of_winning_race(30, 200) == 9
+assert num_ways_of_winning_race(10, 25) == 0
+# Way beyond what a float can handle. The roots are exactly 10**40 and 3 * 10**40, which a float
+# sqrt couldn't tell apart from their neighbours.
+assert num_ways_of_winning_race(4 * 10 ** 40, 3 * 10 ** 80) == 2 * 10 ** 40 - 1
+assert list(num_ways_of_winning_races([7, 15, 30, 10, 0, 3_000_000_000], [9, 40, 200, 25, 0, 10 ** 18])) == [4, 8, 9, 0, 0, num_ways_of_winning_race(3_000_000_000, 10 ** 18)]
+assert list(num_ways_of_winning_races([10 ** 30], [10 ** 59])) == [num_ways_of_winning_race(10 ** 30, 10 ** 59)]
+# A negative record can be beaten by every press, even not pressing at all
+assert num_ways_of_winning_race(10, -5) == 11
+assert list(num_ways_of_winning_races([10, 1, 0, 10], [-5, -1, -1, 5])) == [11, 2, 0, num_ways_of_winning_race(10, 5)]
+
 assert answer_for_input_file("test_input.txt") == 288
 assert answer_for_input_file("real_input.txt") == 633080
 assert answer_for_input_file("test_input.txt", smoosh_numbers=True) == 71503
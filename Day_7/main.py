@@ -2,6 +2,9 @@
 
 from enum import Enum
 import functools
+import itertools
+
+import numpy as np
 
 class Hand(Enum):
     HIGH_CARD = 0
@@ -100,33 +103,114 @@ def type_of_hand_jacks_are_wild(hand):
         case 4 | 5:
             return Hand.FIVE_OF_A_KIND
 
+# The two functions above are how I first worked the hand types out. They're kept as the reference
+# the lookup tables below are checked against, but everything else goes through the tables.
+
+def hand_type_for_counts(counts, num_jokers):
+    """The best Hand we can make given how many of each (non joker) card we have, largest count
+    first, and how many jokers we have. Jokers always do best joining the biggest group."""
+    top = (counts[0] if counts else 0) + num_jokers
+    second = counts[1] if len(counts) > 1 else 0
+    if top == 5:
+        return Hand.FIVE_OF_A_KIND
+    elif top == 4:
+        return Hand.FOUR_OF_A_KIND
+    elif top == 3:
+        return Hand.FULL_HOUSE if second == 2 else Hand.THREE_OF_A_KIND
+    elif top == 2:
+        return Hand.TWO_PAIR if second == 2 else Hand.PAIR
+    else:
+        return Hand.HIGH_CARD
+
+def partitions(n, largest=None):
+    """Every way of writing n as a sum of positive ints, largest first."""
+    if n == 0:
+        yield ()
+        return
+    for first in range(min(n, largest or n), 0, -1):
+        for rest in partitions(n - first, first):
+            yield (first,) + rest
+
+# Every possible hand signature: the sorted card counts plus the number of jokers. There are only a
+# few dozen of them, compared to 13^5 hands.
+SIGNATURE_TYPES = {
+    (counts, num_jokers): hand_type_for_counts(counts, num_jokers)
+    for num_jokers in range(6)
+    for counts in partitions(5 - num_jokers)
+}
+
+def hand_signature(hand, jacks_are_wild):
+    num_jokers = 0
+    if jacks_are_wild and "J" in hand:
+        num_jokers = hand.count("J")
+        hand = hand.replace("J", "")
+    return tuple(sorted(map(hand.count, set(hand)), reverse=True)), num_jokers
+
+# There are only 13^5 possible hands per mode, so we fill in a table of them as we come across them.
+@functools.cache
 def type_of_hand(hand, jacks_are_wild):
-    return type_of_hand_jacks_are_wild(hand) if jacks_are_wild else type_of_hand_jacks_not_wild(hand)
-
-def group_hands(hand_bid_pairs, jacks_are_wild):
-    grouping = {}
-    for hand_bid_pair in hand_bid_pairs:
-        tpe = type_of_hand(hand_bid_pair[0], jacks_are_wild)
-        grouping.setdefault(tpe, []).append(hand_bid_pair)
-    return grouping
-
-def compare_hand_bid_pairs_of_same_type(jacks_are_wild, hand_bid_pair1, hand_bid_pair2):
-    hand1 = hand_bid_pair1[0]
-    hand2 = hand_bid_pair2[0]
-    for i in range(0, len(hand1)):
-        left_value = label_value(hand1[i], jacks_are_wild)
-        right_value = label_value(hand2[i], jacks_are_wild)
-        # TODO: Can I access the default comparison operator for ints and just call that?
-        if left_value < right_value:
-            return -1
-        elif left_value > right_value:
-            return 1
-        else:
-            continue
+    return SIGNATURE_TYPES[hand_signature(hand, jacks_are_wild)]
 
-def sort_hands_of_same_type(hand_bid_pairs, jacks_are_wild):
-    comparison_function = functools.partial(compare_hand_bid_pairs_of_same_type, jacks_are_wild)
-    return sorted(hand_bid_pairs, key=functools.cmp_to_key(comparison_function))
+# Check the table against the hand written versions for every hand we can make out of a few labels.
+# Six labels including J is enough to hit every signature in both modes.
+for reference_hand in itertools.product("2345AJ", repeat=5):
+    reference_hand = "".join(reference_hand)
+    assert type_of_hand(reference_hand, False) == type_of_hand_jacks_not_wild(reference_hand)
+    assert type_of_hand(reference_hand, True) == type_of_hand_jacks_are_wild(reference_hand)
+
+# label_value as a str.translate table to hex digits. Every label value fits in 4 bits, so a whole
+# hand translates into a 5 digit hex string and int(..., 16) packs it for us.
+HEX_LABELS = {
+    jacks_are_wild: str.maketrans({label: f"{label_value(label, jacks_are_wild):x}" for label in "AKQJT98765432"})
+    for jacks_are_wild in [False, True]
+}
+
+def hand_sort_key(hand, jacks_are_wild):
+    """A single int which orders hands the same way the puzzle does: the type of hand in the high
+    bits, then the five card values, 4 bits each, first card most significant."""
+    return type_of_hand(hand, jacks_are_wild).value << 20 | int(hand.translate(HEX_LABELS[jacks_are_wild]), 16)
+
+assert hand_sort_key("32T3K", jacks_are_wild=False) == (Hand.PAIR.value << 20) | 0x32A3D
+assert hand_sort_key("KTJJT", jacks_are_wild=True) == (Hand.FOUR_OF_A_KIND.value << 20) | 0xDA11A
+assert hand_sort_key("2AAAA", False) < hand_sort_key("33332", False) < hand_sort_key("22222", False)
+
+# The same thing for NumPy. Once jokers have joined the biggest group, the type only depends on the
+# biggest group (top) and the next biggest (second), so index this by [top, second].
+TYPE_BY_TOP_TWO = np.array([[hand_type_for_counts((top, second), 0).value for second in range(6)] for top in range(6)])
+
+# Like HEX_LABELS but mapping each label straight to a character whose code is its value.
+CARD_VALUE_LABELS = {
+    jacks_are_wild: str.maketrans({label: chr(label_value(label, jacks_are_wild)) for label in "AKQJT98765432"})
+    for jacks_are_wild in [False, True]
+}
+
+def encode_hands(hands, jacks_are_wild):
+    """An (n, 5) array of the card values in each hand."""
+    encoded = "".join(hands).translate(CARD_VALUE_LABELS[jacks_are_wild]).encode("latin-1")
+    return np.frombuffer(encoded, dtype=np.uint8).reshape(-1, 5)
+
+def classify_hands(encoded_hands, jacks_are_wild):
+    """type_of_hand for every row of encode_hands at once, as an array of Hand values."""
+    # counts[i, v] is how many cards of value v hand i has
+    rows = np.arange(len(encoded_hands))[:, np.newaxis] * 16
+    counts = np.bincount((rows + encoded_hands).ravel(), minlength=16 * len(encoded_hands)).reshape(-1, 16)
+    num_jokers = 0
+    if jacks_are_wild:
+        # Jokers are worth 1 when they're wild
+        num_jokers = counts[:, 1].copy()
+        counts[:, 1] = 0
+    counts.sort(axis=1)
+    return TYPE_BY_TOP_TWO[counts[:, -1] + num_jokers, counts[:, -2]]
+
+def hand_sort_keys(encoded_hands, jacks_are_wild):
+    """hand_sort_key for every row of encode_hands at once."""
+    card_bits = (encoded_hands.astype(np.int64) << np.array([16, 12, 8, 4, 0])).sum(axis=1)
+    return classify_hands(encoded_hands, jacks_are_wild).astype(np.int64) << 20 | card_bits
+
+reference_hands = ["".join(reference_hand) for reference_hand in itertools.product("2345AJ", repeat=5)]
+for jacks_are_wild in [False, True]:
+    keys = hand_sort_keys(encode_hands(reference_hands, jacks_are_wild), jacks_are_wild)
+    assert list(keys) == [hand_sort_key(hand, jacks_are_wild) for hand in reference_hands]
 
 # Note: Passing jacks_are_wild all the way through the chain is pretty ugly. This could have been
 # solved using OO or possibly with a bit more thought on function design. But AoC only gives you
@@ -139,20 +223,14 @@ def compute_score(filename, jacks_are_wild=False):
     with open(filename) as f:
         hand_bid_pairs = [line.split() for line in f.readlines()]
 
-    hand_groups = group_hands(hand_bid_pairs, jacks_are_wild)
-    for type_, hand_bid_pairs in hand_groups.items():
-        # N.B. You shouldn't really modify during iteration, but we're not going to change
-        # the keys so this should be fine.
-        hand_groups[type_] = sort_hands_of_same_type(hand_bid_pairs, jacks_are_wild=jacks_are_wild)
-
-    rank = 1
-    total_points = 0
-    # Yuck. Making assumptions about the enum. Bit of a hack. Doesn't matter for AoC
-    for i in range(Hand.HIGH_CARD.value, Hand.FIVE_OF_A_KIND.value + 1):
-        for hand_bid_pair in hand_groups.get(Hand(i), []):
-            total_points += int(hand_bid_pair[1]) * rank
-            rank += 1
-    return total_points
+    hands = [hand for hand, _ in hand_bid_pairs]
+    bids = np.array([int(bid) for _, bid in hand_bid_pairs], dtype=np.int64)
+
+    # Work out every hand's key in one go, then ranking them is a single argsort over ints.
+    keys = hand_sort_keys(encode_hands(hands, jacks_are_wild), jacks_are_wild)
+    order = np.argsort(keys, kind="stable")
+    ranks = np.arange(1, len(hands) + 1, dtype=np.int64)
+    return int((bids[order] * ranks).sum())
 
 assert compute_score("test_input.txt") == 6440
 assert compute_score("real_input.txt") == 250474325
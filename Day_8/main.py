@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 
+import functools
 import math
+import multiprocessing
 import re
+from multiprocessing import shared_memory
+
+import numpy as np
 
 def read_input(filename):
     with open(filename) as f:
@@ -36,25 +41,298 @@ def step_to_the_end(current_nodes, rl_instructions, mappings):
 
     return step_count
 
-def answer_part_1(filename):
-    rl_instructions, mappings = read_input(filename)
-    start_nodes = ["AAA"]
-    return step_to_the_end(start_nodes, rl_instructions, mappings)
-
-assert answer_part_1("test_input1.txt") == 2
-assert answer_part_1("test_input2.txt") == 6
-assert answer_part_1("real_input.txt") == 15871
-
-def answer_part_2(filename):
-    rl_instructions, mappings = read_input(filename)
-    start_nodes = []
-    for key in mappings.keys():
-        if key[2] == "A":
-            start_nodes.append(key)
-    steps_per_node = []
-    for node in start_nodes:
-        steps_per_node.append(step_to_the_end([node], rl_instructions, mappings))
-    return math.lcm(*steps_per_node)
-
-assert answer_part_2("test_input3.txt") == 6
-print(f"Answer to part 2 is {answer_part_2('real_input.txt')}")
+# Marks "never gets to a Z" in the int64 step count tables below.
+NO_HIT = -1
+
+class CompiledNetwork:
+    """The network compiled down to integer node ids, plus jump tables for taking many steps at once.
+
+    left[i] and right[i] are the ids of node i's successors and is_end[i] says whether node i ends
+    in a Z. A "pass" is following the whole RL instruction string once. pass_jumps[k][i] is where
+    you end up after 2^k passes starting from node i, and pass_hits[k][i] is how many steps it takes
+    to first land on a Z within those 2^k passes (or NO_HIT). With those we can answer questions
+    about any number of steps in O(log(steps)) table lookups rather than walking every step.
+    """
+
+    def __init__(self, rl_instructions, mappings):
+        self.names = list(mappings.keys())
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.left = np.array([self.ids[mappings[name][0]] for name in self.names], dtype=np.int64)
+        self.right = np.array([self.ids[mappings[name][1]] for name in self.names], dtype=np.int64)
+        self.is_end = np.array([name[2] == "Z" for name in self.names])
+        self.instructions = [self.right if rl == "R" else self.left for rl in rl_instructions]
+        self.rl_instructions = rl_instructions
+        self.pass_length = len(rl_instructions)
+
+        # Work backwards through the instructions, so that at each point we know, for every node,
+        # where we finish the pass and how many steps until we first hit a Z if we start the rest
+        # of the pass from there.
+        num_nodes = len(self.names)
+        pass_end = np.arange(num_nodes)
+        first_hit = np.full(num_nodes, NO_HIT, dtype=np.int64)
+        for successors in reversed(self.instructions):
+            hit_later = first_hit[successors]
+            first_hit = np.where(self.is_end[successors], 1, np.where(hit_later == NO_HIT, NO_HIT, hit_later + 1))
+            pass_end = pass_end[successors]
+
+        # Every node is back where it started its cycle within num_nodes passes, so that many
+        # passes is as far as steps_to_first_end ever needs to look. The hit tables stop there,
+        # which also keeps the step counts in them well inside an int64. position_after can add
+        # more levels of pass_jumps if it needs them.
+        self.pass_jumps = [pass_end]
+        self.pass_hits = [first_hit]
+        while 2 ** (len(self.pass_jumps) - 1) <= num_nodes:
+            self.add_jump_level()
+
+    @functools.cached_property
+    def successor_lists(self):
+        """left, right, is_end and the one pass jump table as plain lists, which are much quicker
+        than NumPy arrays to index one element at a time."""
+        return [table.tolist() for table in (self.left, self.right, self.is_end, self.pass_jumps[0])]
+
+    def add_jump_level(self):
+        """Extend both sets of tables to twice as many passes as they currently cover."""
+        jump, hit = self.pass_jumps[-1], self.pass_hits[-1]
+        steps = 2 ** (len(self.pass_jumps) - 1) * self.pass_length
+        hit_later = hit[jump]
+        self.pass_hits.append(np.where(hit != NO_HIT, hit, np.where(hit_later == NO_HIT, NO_HIT, hit_later + steps)))
+        self.pass_jumps.append(jump[jump])
+
+    def position_after(self, node, steps):
+        """Where we are after taking steps steps from node. Whole passes are jumped over using the
+        tables, only the final partial pass is walked a step at a time."""
+        node = self.ids[node]
+        passes, remainder = divmod(steps, self.pass_length)
+        while len(self.pass_jumps) < passes.bit_length():
+            jump = self.pass_jumps[-1]
+            self.pass_jumps.append(jump[jump])
+        for k in range(passes.bit_length()):
+            if passes >> k & 1:
+                node = int(self.pass_jumps[k][node])
+        left, right, _, _ = self.successor_lists
+        for rl in self.rl_instructions[:remainder]:
+            node = right[node] if rl == "R" else left[node]
+        return self.names[node]
+
+    def steps_to_first_end(self, node):
+        """How many steps before we first land on a node ending in Z, or None if we never do."""
+        node = self.ids[node]
+        if self.is_end[node]:
+            return 0
+        if self.pass_hits[-1][node] == NO_HIT:
+            return None
+        # Take the biggest jumps we can without going past the first Z
+        steps = 0
+        for k in reversed(range(len(self.pass_hits))):
+            if self.pass_hits[k][node] == NO_HIT:
+                steps += 2 ** k * self.pass_length
+                node = self.pass_jumps[k][node]
+        return steps + int(self.pass_hits[0][node])
+
+def compile_network(filename):
+    return CompiledNetwork(*read_input(filename))
+
+for test_file in ["test_input1.txt", "test_input2.txt", "test_input3.txt"]:
+    rl_instructions, mappings = read_input(test_file)
+    network = CompiledNetwork(rl_instructions, mappings)
+    for node in mappings.keys():
+        if node[2] == "A":
+            assert network.steps_to_first_end(node) == step_to_the_end([node], rl_instructions, mappings)
+    start = "AAA" if "AAA" in mappings else "11A"
+    for steps in range(20):
+        walked = start
+        for i in range(steps):
+            walked = mappings[walked][1 if rl_instructions[i % len(rl_instructions)] == "R" else 0]
+        assert network.position_after(start, steps) == walked
+# 22A steps onto a cycle of length 3 at 22B, so we're back on 22B after 1 + any multiple of 3 steps
+assert CompiledNetwork(*read_input("test_input3.txt")).position_after("22A", 1 + 6 * 10 ** 18) == "22B"
+assert CompiledNetwork("L", {"AAA": ["AAA", "AAA"]}).steps_to_first_end("AAA") is None
+# Far more steps than fit in an int64, which only needs more pass_jumps levels
+flip_flop = CompiledNetwork("L", {"AAA": ["BBB", "BBB"], "BBB": ["AAA", "AAA"], "CCZ": ["AAA", "AAA"]})
+assert flip_flop.position_after("AAA", 2 ** 64) == "AAA"
+assert flip_flop.position_after("AAA", 3 ** 100) == "BBB"
+assert flip_flop.steps_to_first_end("AAA") is None
+
+# The answer functions all take a CompiledNetwork, so a network (and its jump tables) only has to
+# be built once however many questions we ask of it.
+def answer_part_1(network):
+    return network.steps_to_first_end("AAA")
+
+assert answer_part_1(compile_network("test_input1.txt")) == 2
+assert answer_part_1(compile_network("test_input2.txt")) == 6
+
+class GhostCycle:
+    """Every step count at which a ghost is on a Z.
+
+    The ghost's state is its node plus where it is in the RL instructions. There are only so many
+    of those, so after tail_length steps it is going round a cycle of cycle_length steps forever.
+    tail_hits are the Z hits before the cycle starts and cycle_offsets are where in the cycle the Z
+    hits are, i.e. the ghost is on a Z at step tail_length + offset + k * cycle_length for any k.
+    """
+
+    def __init__(self, tail_length, cycle_length, tail_hits, cycle_offsets):
+        self.tail_length = tail_length
+        self.cycle_length = cycle_length
+        self.tail_hits = tail_hits
+        self.cycle_offsets = cycle_offsets
+
+    def is_at_end(self, step):
+        if step < self.tail_length:
+            return step in self.tail_hits
+        return (step - self.tail_length) % self.cycle_length in self.cycle_offsets
+
+def walk_ghost(left, right, is_end, pass_end, rl_instructions, start):
+    """ghost_cycle on the raw successor tables. These can be anything indexable by node id, which
+    lets the process pool workers below use views straight onto shared memory."""
+    pass_length = len(rl_instructions)
+
+    # Two states can only match if they're at the same point in the instructions, so the cycle is a
+    # whole number of passes. That means we can find it by only looking at the nodes at the start of
+    # each pass. The tail we find this way might be a little longer than it strictly needs to be,
+    # which doesn't matter.
+    node = start
+    first_seen = {}
+    while node not in first_seen:
+        first_seen[node] = len(first_seen)
+        node = pass_end[node]
+    tail_length = first_seen[node] * pass_length
+    cycle_length = (len(first_seen) - first_seen[node]) * pass_length
+
+    # Now walk it to find where the Zs are
+    go_right = [rl == "R" for rl in rl_instructions]
+    node = start
+    tail_hits = set()
+    cycle_offsets = set()
+    for step in range(tail_length + cycle_length):
+        if is_end[node]:
+            if step < tail_length:
+                tail_hits.add(step)
+            else:
+                cycle_offsets.add(step - tail_length)
+        node = right[node] if go_right[step % pass_length] else left[node]
+    return GhostCycle(tail_length, cycle_length, tail_hits, cycle_offsets)
+
+def ghost_cycle(network, start):
+    return walk_ghost(*network.successor_lists, network.rl_instructions, network.ids[start])
+
+# Set in each pool worker by attach_shared_network
+shared_network = None
+
+def attach_shared_network(shm_name, num_nodes, rl_instructions):
+    global shared_network
+    shm = shared_memory.SharedMemory(name=shm_name)
+    tables = shm.buf.cast("q")
+    # Slicing a memoryview doesn't copy anything, so every worker reads the one copy of the graph.
+    shared_network = (shm, [tables[i * num_nodes:(i + 1) * num_nodes] for i in range(4)], rl_instructions)
+
+def walk_shared_ghost(start):
+    _, tables, rl_instructions = shared_network
+    return walk_ghost(*tables, rl_instructions, start)
+
+def ghost_cycles_in_parallel(network, start_nodes, processes=None):
+    """ghost_cycle for each of start_nodes, fanned out over a process pool.
+
+    The successor tables are copied once into a shared memory block which every worker maps, so
+    however many ghosts (or workers) there are, the graph is never pickled or copied per worker.
+    """
+    num_nodes = len(network.names)
+    tables = [network.left, network.right, network.is_end, network.pass_jumps[0]]
+    shm = shared_memory.SharedMemory(create=True, size=max(1, 4 * num_nodes * 8))
+    try:
+        shared = np.ndarray((4, num_nodes), dtype=np.int64, buffer=shm.buf)
+        for i, table in enumerate(tables):
+            shared[i] = table
+        del shared
+        with multiprocessing.Pool(processes, initializer=attach_shared_network,
+                                  initargs=(shm.name, num_nodes, network.rl_instructions)) as pool:
+            return pool.map(walk_shared_ghost, [network.ids[node] for node in start_nodes])
+    finally:
+        shm.close()
+        shm.unlink()
+
+def combine_congruences(r1, m1, r2, m2):
+    """Generalised Chinese Remainder Theorem: the (r, m) with x = r (mod m) exactly when x = r1 (mod
+    m1) and x = r2 (mod m2), or None if there's no such x. m1 and m2 needn't be coprime."""
+    g = math.gcd(m1, m2)
+    if (r2 - r1) % g != 0:
+        return None
+    m = m1 // g * m2
+    k = (r2 - r1) // g * pow(m1 // g, -1, m2 // g) % (m2 // g)
+    return (r1 + m1 * k) % m, m
+
+assert combine_congruences(2, 3, 3, 5) == (8, 15)
+assert combine_congruences(1, 4, 3, 6) == (9, 12)
+assert combine_congruences(1, 4, 2, 6) is None
+
+def first_simultaneous_arrival(cycles):
+    """The first step at which every ghost is on a Z, or None if that never happens."""
+    settled = max(cycle.tail_length for cycle in cycles)
+
+    # Before every ghost is on its cycle there are only finitely many steps to check, so just check
+    # each step the first ghost is on a Z.
+    first = cycles[0]
+    early_hits = set(hit for hit in first.tail_hits if hit < settled)
+    for offset in first.cycle_offsets:
+        early_hits.update(range(first.tail_length + offset, settled, first.cycle_length))
+    for step in sorted(early_hits):
+        if all(cycle.is_at_end(step) for cycle in cycles):
+            return step
+
+    # After that every ghost is periodic, so each one pins the step down to a handful of residues.
+    # Fold the ghosts in one at a time, keeping every residue that's consistent so far.
+    residues, modulus = {0}, 1
+    for cycle in cycles:
+        combined = set()
+        for residue in residues:
+            for offset in cycle.cycle_offsets:
+                congruence = combine_congruences(residue, modulus, cycle.tail_length + offset, cycle.cycle_length)
+                if congruence is not None:
+                    combined.add(congruence[0])
+        residues, modulus = combined, modulus // math.gcd(modulus, cycle.cycle_length) * cycle.cycle_length
+        if not residues:
+            return None
+
+    # The smallest step >= settled for each residue
+    return min(settled + (residue - settled) % modulus for residue in residues)
+
+def answer_part_2(network, processes=1):
+    start_nodes = [node for node in network.names if node[2] == "A"]
+    if processes == 1:
+        cycles = [ghost_cycle(network, node) for node in start_nodes]
+    else:
+        cycles = ghost_cycles_in_parallel(network, start_nodes, processes)
+    return first_simultaneous_arrival(cycles)
+
+def answer_part_2_assuming_lcm(network):
+    """What I originally submitted. It only works because the puzzle input is built so that each
+    ghost's first Z is exactly one cycle length into its walk, which isn't true in general."""
+    start_nodes = [node for node in network.names if node[2] == "A"]
+    return math.lcm(*[network.steps_to_first_end(node) for node in start_nodes])
+
+# 11A is on a Z at every odd step. 22A first hits a Z at step 2, then every 3 steps after that. The
+# LCM of the first hits says 2, but 11A isn't on a Z then. The first step that works is 5.
+lcm_breaker = {
+    "11A": ["11Z", "11Z"], "11Z": ["11A", "11A"],
+    "22A": ["22B", "22B"], "22B": ["22Z", "22Z"], "22Z": ["22C", "22C"], "22C": ["22D", "22D"], "22D": ["22Z", "22Z"],
+}
+lcm_breaker_network = CompiledNetwork("L", lcm_breaker)
+assert math.lcm(*[lcm_breaker_network.steps_to_first_end(node) for node in ["11A", "22A"]]) == 2
+assert first_simultaneous_arrival([ghost_cycle(lcm_breaker_network, node) for node in ["11A", "22A"]]) == 5
+# 33A is only ever on a Z at even steps, so it can never line up with 11A
+lcm_breaker.update({"33A": ["33B", "33B"], "33B": ["33Z", "33Z"], "33Z": ["33B", "33B"]})
+never_cycles = [ghost_cycle(CompiledNetwork("L", lcm_breaker), node) for node in ["22A", "33A", "11A"]]
+assert first_simultaneous_arrival(never_cycles[1:]) is None
+assert first_simultaneous_arrival(never_cycles[:2]) == 2
+
+assert answer_part_2(compile_network("test_input3.txt")) == 6
+
+# Pool workers import this file too (and with the "spawn" start method they run everything at the
+# top level again), so only the parent process should work on the real input or start a pool.
+if __name__ == "__main__":
+    assert answer_part_2(compile_network("test_input3.txt"), processes=2) == 6
+
+    network = compile_network("real_input.txt")
+    assert answer_part_1(network) == 15871
+    assert answer_part_2(network) == answer_part_2_assuming_lcm(network)
+    # None means one worker per core
+    print(f"Answer to part 2 is {answer_part_2(network, processes=None)}")
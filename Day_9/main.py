@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 
+import functools
 import math
+from enum import Enum
+
+import numpy as np
 
 def parse_input(filename):
     sequences = []
@@ -11,12 +15,10 @@ def parse_input(filename):
     return sequences
 
 def num_diffs_to_stabilise(sequence):
-    input_sequence = sequence
     diffs = 0
     while set(sequence) != set([0]):
         sequence = [ x - y for (x, y) in zip(sequence[1:], sequence[:-1])]
         diffs += 1
-    print(f"{diffs} iterations to stabilise {input_sequence}")
     return diffs
 
 def next_value_in_sequence(sequence):
@@ -36,32 +38,140 @@ def next_value_in_sequence(sequence):
 
     """
     n = num_diffs_to_stabilise(sequence)
-    coefficients = [0] * len(sequence)
-    start_sign = 1
-    for i in range(1, n+1):
-        coefficients[i-1] = math.comb(n, i) * start_sign
-        start_sign *= -1
-    # print(f"Coefficients are {coefficients}")
+    weights = extrapolation_weights(len(sequence), n, Direction.FORWARD, 1)
+    return sum([x * y for (x, y) in zip(sequence, weights)])
+
+class Direction(Enum):
+    FORWARD = 0
+    BACKWARD = 1
+
+@functools.cache
+def extrapolation_weights(length, order, direction, steps):
+    """The weights w such that sum(w[i] * a[i]) is the value steps places past the end (FORWARD) or
+    before the start (BACKWARD) of any sequence a of the given length which stabilises after at
+    most order diffs. Tables are cached, so each (length, order, direction, steps) is only ever
+    worked out once.
+
+    This is the next_value_in_sequence formula generalised to more than one step, i.e. Newton's
+    backward difference formula. With a_m the last element:
+
+    a_(m+k) = sum over r < order of (k+r-1 choose r) * (r-th backward difference at a_m)
+
+    and the r-th backward difference is sum over j <= r of (-1)^j * (r choose j) * a_(m-j). For
+    k = 1 the weight on a_(m-j) collapses to (-1)^j * (order choose j+1), as before.
+
+    A sequence that stabilises after n diffs also stabilises after any more than n, so order=length
+    works for every sequence of that length. That's what lets a whole batch share one table.
+    """
+    if order > length:
+        raise ValueError(f"Can't use {order} diffs on a sequence of length {length}")
+    weights = [0] * length
+    for j in range(order):
+        weight = sum(math.comb(steps + r - 1, r) * math.comb(r, j) for r in range(j, order))
+        weights[length - 1 - j] = (-1) ** j * weight
+    if direction == Direction.BACKWARD:
+        # Going backwards is going forwards along the reversed sequence
+        weights.reverse()
+    return tuple(weights)
+
+assert extrapolation_weights(3, 2, Direction.FORWARD, 1) == (0, -1, 2)
+assert extrapolation_weights(3, 3, Direction.FORWARD, 1) == (1, -3, 3)
+assert extrapolation_weights(3, 2, Direction.FORWARD, 2) == (0, -2, 3)
+assert extrapolation_weights(3, 2, Direction.BACKWARD, 1) == (2, -1, 0)
+
+def extrapolate_batch(sequences, steps=1, direction=Direction.FORWARD, order=None):
+    """The value steps places past the end (or before the start) of each row of a 2-D array of
+    equal length sequences, as a single matrix-vector product with a cached weight table.
+
+    order defaults to the sequence length, which is right for every sequence (see
+    extrapolation_weights). Pass a smaller order if you know the sequences stabilise sooner; it
+    makes the weights smaller. We use int64 when the result can't possibly overflow and Python ints
+    otherwise.
+    """
+    sequences = np.asarray(sequences)
+    length = sequences.shape[1]
+    weights = extrapolation_weights(length, length if order is None else order, direction, steps)
+    biggest = max(int(sequences.max()), -int(sequences.min())) if sequences.size else 0
+    if sequences.dtype != object and (biggest * sum(abs(w) for w in weights)).bit_length() < 63:
+        return sequences.astype(np.int64) @ np.array(weights, dtype=np.int64)
+    return sequences.astype(object) @ np.array(weights, dtype=object)
 
-    next_value = sum([x * y for (x, y) in zip(reversed(sequence), coefficients)])
-    return next_value
+assert list(extrapolate_batch(np.array([[0, 3, 6, 9, 12, 15], [10, 13, 16, 21, 30, 45]]))) == [18, 68]
+assert list(extrapolate_batch(np.array([[0, 3, 6, 9, 12, 15], [10, 13, 16, 21, 30, 45]]), direction=Direction.BACKWARD)) == [-3, 5]
+assert list(extrapolate_batch(np.array([[1, 3, 6, 10, 15, 21]]), steps=3)) == [45]
+assert list(extrapolate_batch([[2 ** 70, 2 ** 71]])) == [3 * 2 ** 70]
+assert list(extrapolate_batch(np.array([[1, 3, 6, 10, 15, 21]]), steps=3, direction=Direction.BACKWARD, order=3)) == [1]
+
+def extrapolate_equal_length(sequences):
+    """Next and previous values for a 2-D array of sequences, one per row, all at once.
+
+    We build the usual difference pyramid for every row together with np.diff. The next value is
+    the sum of the last element of every level, and the previous value is the alternating sum of
+    the first elements. Both come out of the same pass.
+
+    Each level of differences is at most twice as big as the one above it, so if the biggest input
+    times 2^(length + 1) fits in an int64 nothing can overflow. Otherwise we do the same thing with
+    Python ints in an object array, which is slower but exact.
+    """
+    try:
+        sequences = np.array(sequences, dtype=np.int64)
+        biggest = max(int(sequences.max()), -int(sequences.min())) if sequences.size else 0
+        if biggest.bit_length() + sequences.shape[1] + 1 >= 63:
+            sequences = sequences.astype(object)
+    except OverflowError:
+        sequences = np.array(sequences, dtype=object)
+
+    next_values = np.zeros(len(sequences), dtype=sequences.dtype)
+    previous_values = np.zeros(len(sequences), dtype=sequences.dtype)
+    level = sequences
+    sign = 1
+    while level.shape[1] > 0 and (level != 0).any():
+        next_values += level[:, -1]
+        previous_values += sign * level[:, 0]
+        sign = -sign
+        level = np.diff(level, axis=1)
+    return next_values, previous_values
+
+def extrapolate_sequences(sequences):
+    """Next and previous values for every sequence in a list of lists, in the same order. Sequences
+    are grouped by length so each group can go through extrapolate_equal_length in one go."""
+    by_length = {}
+    for i, sequence in enumerate(sequences):
+        by_length.setdefault(len(sequence), []).append(i)
+
+    next_values = [0] * len(sequences)
+    previous_values = [0] * len(sequences)
+    for indices in by_length.values():
+        group_next, group_previous = extrapolate_equal_length([sequences[i] for i in indices])
+        for i, next_value, previous_value in zip(indices, group_next, group_previous):
+            next_values[i] = int(next_value)
+            previous_values[i] = int(previous_value)
+    return next_values, previous_values
+
+assert extrapolate_sequences([[0, 3, 6, 9, 12, 15], [10, 13, 16, 21, 30, 45], [5, 5]]) == ([18, 68, 5], [-3, 5, 5])
+# Big enough that the int64 version would overflow
+assert extrapolate_sequences([[2 ** 62, 2 ** 63, 3 * 2 ** 62]]) == ([2 ** 64], [0])
+
+def answers(filename):
+    """The answers to both parts from one trip through the difference pyramids."""
+    next_values, previous_values = extrapolate_sequences(parse_input(filename))
+    return sum(next_values), sum(previous_values)
 
 def answer_part_1(filename):
-    total = 0
-    for sequence in parse_input(filename):
-        total += next_value_in_sequence(sequence)
-    return total
+    return answers(filename)[0]
+
+# The vectorised version has to agree with the formula it replaced
+assert extrapolate_sequences(parse_input('real_input.txt'))[0] == [next_value_in_sequence(sequence) for sequence in parse_input('real_input.txt')]
+
+real_sequences = np.array(parse_input('real_input.txt'))
+assert list(extrapolate_batch(real_sequences)) == extrapolate_sequences(parse_input('real_input.txt'))[0]
+assert list(extrapolate_batch(real_sequences, direction=Direction.BACKWARD)) == extrapolate_sequences(parse_input('real_input.txt'))[1]
 
 assert answer_part_1('test_input.txt')  == 114
 assert answer_part_1('real_input.txt')  == 1974232246
 
 def answer_part_2(filename):
-    total = 0
-    sequences = parse_input(filename)
-    sequences = [list(reversed(sequence)) for sequence in sequences]
-    for sequence in sequences:
-        total += next_value_in_sequence(sequence)
-    return total
+    return answers(filename)[1]
 
 assert answer_part_2('test_input.txt')  == 2
-print(f"Answer to part 2 is {answer_part_2('real_input.txt')}")
\ No newline at end of file
+print(f"Answer to part 2 is {answer_part_2('real_input.txt')}")